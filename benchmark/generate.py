@@ -0,0 +1,132 @@
+import argparse
+import json
+import random
+import tempfile
+from datetime import date, timedelta
+from typing import Dict, Tuple
+
+
+def format_date(day: date) -> str:
+    """Format a date like the exports do: month and day are not zero-padded"""
+    return f'{day.year}-{day.month}-{day.day}'
+
+
+def generate(
+    path: str,
+    cars: int,
+    rentals: int,
+    seed: int = 42,
+    price_per_day: Tuple[int, int] = (1500, 10000),
+    price_per_km: Tuple[int, int] = (5, 30),
+    mean_duration: float = 4,
+    max_duration: int = 60,
+    mean_distance: float = 300,
+    options: Dict[str, float] = None,
+    start: date = date(2015, 1, 1),
+    end: date = date(2017, 12, 31),
+) -> None:
+    """Write a realistic input.json, element by element so any size fits in memory.
+        The prices per day are high enough for the commission to cover
+        the assistance (100 cents/day) whatever the discount
+    Args:
+        path (str): path of the generated json file
+        cars (int): number of cars
+        rentals (int): number of rentals
+        seed (int): seed of the random generator
+        price_per_day (Tuple[int, int]): range of the car prices per day, in cents
+        price_per_km (Tuple[int, int]): range of the car prices per km, in cents
+        mean_duration (float): mean of the (exponential) rental durations, in days
+        max_duration (int): longest rental duration, in days
+        mean_distance (float): mean of the (exponential) rental distances, in km
+        options (Dict[str, float]): probability of each option type per rental
+        start (date): earliest start date of a rental
+        end (date): latest start date of a rental
+    """
+    if options is None:
+        options = {'gps': 0.3, 'baby_seat': 0.1, 'additional_insurance': 0.2}
+    rng = random.Random(seed)
+    option_id = 0
+
+    with open(path, 'w') as fd, tempfile.TemporaryFile('w+') as options_fd:
+        fd.write('{\n  "cars": [')
+        for car_id in range(1, cars + 1):
+            fd.write(',\n    ' if car_id > 1 else '\n    ')
+            fd.write(json.dumps({
+                'id': car_id,
+                'price_per_day': rng.randrange(price_per_day[0], price_per_day[1] + 1, 100),
+                'price_per_km': rng.randint(*price_per_km),
+            }))
+        fd.write('\n  ],\n  "rentals": [')
+        for rental_id in range(1, rentals + 1):
+            duration = min(max_duration, 1 + int(rng.expovariate(1 / mean_duration)))
+            start_date = start + timedelta(days=rng.randrange((end - start).days + 1))
+            fd.write(',\n    ' if rental_id > 1 else '\n    ')
+            fd.write(json.dumps({
+                'id': rental_id,
+                'car_id': rng.randint(1, cars),
+                'start_date': format_date(start_date),
+                'end_date': format_date(start_date + timedelta(days=duration - 1)),
+                'distance': int(rng.expovariate(1 / mean_distance)),
+            }))
+            for option_type, probability in options.items():
+                if rng.random() < probability:
+                    option_id += 1
+                    options_fd.write(',\n    ' if option_id > 1 else '\n    ')
+                    options_fd.write(json.dumps(
+                        {'id': option_id, 'rental_id': rental_id, 'type': option_type}
+                    ))
+        fd.write('\n  ],\n  "options": [')
+        options_fd.seek(0)
+        for chunk in iter(lambda: options_fd.read(1 << 20), ''):
+            fd.write(chunk)
+        fd.write('\n  ]\n}\n')
+
+
+def main():
+    """
+    python3 generate.py --help
+    """
+    parser = argparse.ArgumentParser(
+        description='Generate a synthetic input.json for every level'
+    )
+    parser.add_argument('output', help='Path of the generated json file')
+    parser.add_argument('--rentals', type=int, default=1000, help='Number of rentals')
+    parser.add_argument('--cars', type=int, default=None,
+                        help='Number of cars (default: 1 per 100 rentals)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the random generator')
+    parser.add_argument('--mean-duration', type=float, default=4,
+                        help='Mean rental duration, in days')
+    parser.add_argument('--max-duration', type=int, default=60,
+                        help='Longest rental duration, in days')
+    parser.add_argument('--mean-distance', type=float, default=300,
+                        help='Mean rental distance, in km')
+    parser.add_argument('--options', default='gps=0.3,baby_seat=0.1,additional_insurance=0.2',
+                        help='Probability of each option type per rental, as type=probability,...')
+    parser.add_argument('--start', type=date.fromisoformat, default=date(2015, 1, 1),
+                        help='Earliest start date (YYYY-MM-DD)')
+    parser.add_argument('--end', type=date.fromisoformat, default=date(2017, 12, 31),
+                        help='Latest start date (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    options = {}
+    for option in filter(None, args.options.split(',')):
+        option_type, probability = option.split('=')
+        options[option_type] = float(probability)
+
+    generate(
+        args.output,
+        cars=args.cars or max(1, args.rentals // 100),
+        rentals=args.rentals,
+        seed=args.seed,
+        mean_duration=args.mean_duration,
+        max_duration=args.max_duration,
+        mean_distance=args.mean_distance,
+        options=options,
+        start=args.start,
+        end=args.end,
+    )
+    print(f"Successfully written file at {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from generate import generate
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+DATA_DIR = os.path.join(BENCHMARK_DIR, 'data')
+
+# (level, engine) pairs benchmarked by default
+TARGETS: List[Tuple[int, str]] = [
+    (1, 'scalar'), (2, 'scalar'), (3, 'scalar'), (4, 'scalar'), (5, 'scalar'), (5, 'batch'),
+]
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=ROOT_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def get_input(size: int, seed: int) -> str:
+    """Generate the input of a size once, and reuse it afterwards
+    Args:
+        size (int): number of rentals
+        seed (int): seed of the random generator
+    Returns:
+        str: path of the generated input
+    """
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f'input-{size}-{seed}.json')
+    if not os.path.exists(path):
+        print(f'Generating {path}', flush=True)
+        generate(path, cars=max(1, size // 100), rentals=size, seed=seed)
+    return path
+
+
+def run_target(level: int, engine: str, input_path: str) -> Dict[str, float]:
+    """Time one level in its own process, so levels do not share modules
+    Returns:
+        Dict[str, float]: duration of each stage and peak memory of the process
+    """
+    output_path = os.path.join(DATA_DIR, f'output-level{level}-{engine}.json')
+    process = subprocess.run(
+        [sys.executable, os.path.join(BENCHMARK_DIR, 'stages.py'),
+         str(level), input_path, output_path, '--engine', engine],
+        cwd=os.path.join(ROOT_DIR, f'level{level}'),
+        capture_output=True, text=True, check=True,
+    )
+    os.remove(output_path)
+    return json.loads(process.stdout)
+
+
+def main():
+    """
+    python3 run.py --help
+    """
+    parser = argparse.ArgumentParser(
+        description='Benchmark the parse, compute and serialize stages of every level'
+    )
+    parser.add_argument('--sizes', default='1000,100000',
+                        help='Comma separated numbers of rentals (e.g. 1000,100000,10000000)')
+    parser.add_argument('--levels', default='1,2,3,4,5',
+                        help='Comma separated levels to benchmark')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated inputs')
+    parser.add_argument('--results', default=os.path.join(BENCHMARK_DIR, 'results.jsonl'),
+                        help='Json lines file the results are appended to')
+    args = parser.parse_args()
+
+    levels = {int(level) for level in args.levels.split(',')}
+    run = {
+        'commit': get_commit(),
+        'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+    }
+
+    with open(args.results, 'a') as results_fd:
+        for size in (int(size) for size in args.sizes.split(',')):
+            input_path = get_input(size, args.seed)
+            for level, engine in TARGETS:
+                if level not in levels:
+                    continue
+                timings = run_target(level, engine, input_path)
+                result = dict(run, level=level, engine=engine, rentals=size, **timings)
+                results_fd.write(json.dumps(result) + '\n')
+                results_fd.flush()
+                print(
+                    f"level{level} {engine:6} {size:>10} rentals: "
+                    f"parse {timings['parse']:8.3f}s  compute {timings['compute']:8.3f}s  "
+                    f"serialize {timings['serialize']:8.3f}s  {timings['max_rss_kb'] // 1024} MiB",
+                    flush=True,
+                )
+    print(f'Results appended to {args.results}')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import redirect_stdout
+from typing import Any, Callable, Dict
+
+
+def timed(timings: Dict[str, float], stage: str, function: Callable, *args) -> Any:
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        result = function(*args)
+    timings[stage] = time.perf_counter() - start
+    return result
+
+
+def run_level(level: int, engine: str, input_path: str, output_path: str) -> Dict[str, float]:
+    """Time the parse, compute and serialize stages of a level, from its directory
+    Args:
+        level (int): level number, from 1 to 5
+        engine (str): pricing engine of level 5 (scalar or batch)
+        input_path (str): generated input file
+        output_path (str): output file
+    Returns:
+        Dict[str, float]: duration of each stage, in seconds
+    """
+    timings: Dict[str, float] = {}
+
+    if level <= 3:
+        from main import loadJSON, saveJSON
+        from Getaround import Getaround
+
+        input_data = timed(timings, 'parse', loadJSON, input_path)
+        output = timed(timings, 'compute', Getaround(input_data).compute_rentals)
+        timed(timings, 'serialize', saveJSON, {'rentals': output}, output_path)
+    elif level == 4:
+        from parsing import parse_input
+        from utils.json import saveJSON
+        from Getaround.Getaround import Getaround
+
+        cars, rentals = timed(timings, 'parse', parse_input, input_path)
+        output = timed(timings, 'compute', Getaround(cars, rentals).compute_rentals)
+        timed(timings, 'serialize', saveJSON, {'rentals': output}, output_path)
+    else:
+        from parsing import parse_input, parse_input_table
+        from utils.json import RentalsWriter
+        from Getaround.Getaround import Getaround
+        from Getaround.BatchPricing import BatchPricing
+
+        def serialize(output):
+            with RentalsWriter(output_path) as writer:
+                for rental in output:
+                    writer.write(rental)
+
+        if engine == 'batch':
+            cars, rentals = timed(timings, 'parse', parse_input_table, input_path)
+            output = timed(timings, 'compute', lambda: list(BatchPricing.iter_table(cars, rentals)))
+        else:
+            cars, rentals = timed(timings, 'parse', parse_input, input_path)
+            output = timed(timings, 'compute', Getaround(cars, rentals).compute_rentals)
+        timed(timings, 'serialize', serialize, output)
+    return timings
+
+
+def main():
+    """
+    Run from a level directory: python3 ../benchmark/stages.py --help
+    """
+    parser = argparse.ArgumentParser(
+        description='Time the stages of the level of the current directory, print them as json'
+    )
+    parser.add_argument('level', type=int, choices=range(1, 6), help='Level number')
+    parser.add_argument('input', help='Input json file')
+    parser.add_argument('output', help='Output json file')
+    parser.add_argument('--engine', choices=('scalar', 'batch'), default='scalar',
+                        help='Pricing engine of level 5')
+    args = parser.parse_args()
+
+    sys.path.insert(0, os.getcwd())
+    timings = run_level(args.level, args.engine, args.input, args.output)
+    timings['max_rss_kb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps(timings))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+from typing import Dict, Iterator, List, Sequence
+
+from .CarTable import CarTable
+from .Getaround import Getaround
+from .RentalOptions import RENTAL_OPTIONS
+from .RentalTable import RentalTable
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional
+    np = None
+
+
+class BatchPricing:
+    """Price many rentals at once from columns (one sequence per field).
+    The float operations are the ones of the scalar path (Getaround staticmethods)
+    done in the same order, so the truncated amounts are exactly the same.
+    Options fees are looked up by options mask in RENTAL_OPTIONS.
+    Uses numpy when it is installed, plain python loops otherwise.
+    """
+    ACTORS = ('driver', 'owner', 'insurance', 'assistance', 'drivy')
+
+    @staticmethod
+    def compute(
+        price_per_day: Sequence[int],
+        price_per_km: Sequence[int],
+        duration: Sequence[int],
+        distance: Sequence[int],
+        options_mask: Sequence[int],
+    ) -> Dict[str, Sequence[int]]:
+        """Compute the banking transactions of a batch of rentals
+        Args:
+            price_per_day (Sequence[int]): car price per day in cents, per rental
+            price_per_km (Sequence[int]): car price per km in cents, per rental
+            duration (Sequence[int]): duration of the rentals in days
+            distance (Sequence[int]): distance of the rentals in km
+            options_mask (Sequence[int]): options bitmask of the rentals
+        Returns:
+            Dict[str, Sequence[int]]: signed amount per actor (see ACTORS)
+            and per rental, debits are negative
+        """
+        if np is None:
+            return BatchPricing._compute_python(
+                price_per_day, price_per_km, duration, distance, options_mask
+            )
+        return BatchPricing._compute_numpy(
+            price_per_day, price_per_km, duration, distance, options_mask
+        )
+
+    @staticmethod
+    def _compute_numpy(price_per_day, price_per_km, duration, distance, options_mask):
+        price_per_day = np.asarray(price_per_day, dtype=np.int64)
+        price_per_km = np.asarray(price_per_km, dtype=np.int64)
+        duration = np.asarray(duration, dtype=np.int64)
+        distance = np.asarray(distance, dtype=np.int64)
+        options_mask = np.asarray(options_mask, dtype=np.int64)
+
+        day_price = np.zeros(len(duration), dtype=np.float64)
+        remaining = duration
+        for discount_ratio, min_days in Getaround.DISCOUNT_CURVE.discounts:
+            discounted_days = np.maximum(remaining - min_days, 0)
+            remaining = remaining - discounted_days
+            day_price += discounted_days * discount_ratio * price_per_day
+        price = day_price.astype(np.int64) + distance * price_per_km
+
+        transactions, negative = BatchPricing.compute_transactions(
+            price, duration, options_mask, Getaround.CENTS
+        )
+        if np.any(negative):
+            raise Exception(
+                f'Undefined behavior, drivy_fee are negative for rental at index '
+                f'{np.flatnonzero(negative)[0]}'
+            )
+        return transactions
+
+    @staticmethod
+    def compute_transactions(price, duration, options_mask, cents: bool):
+        """Compute the banking transactions of a batch of rentals with numpy,
+        like Getaround.get_transactions (or get_transactions_cents when cents)
+        followed by Getaround.apply_options_mask
+        Args:
+            price (numpy.ndarray): price of the rentals (int64)
+            duration (numpy.ndarray): duration of the rentals in days (int64)
+            options_mask (numpy.ndarray): options bitmask of the rentals (int64)
+            cents (bool): use integer arithmetic instead of floats
+        Returns:
+            Tuple[Dict[str, numpy.ndarray], numpy.ndarray]: truncated signed
+            amount per actor (see ACTORS), and which rentals have a negative
+            drivy fee before options
+        """
+        if cents:
+            insurance_fee = price * 3 // 20
+            transactions = {
+                'driver': -price,
+                'owner': price * 7 // 10,
+                'insurance': insurance_fee,
+                'assistance': duration * 100,
+            }
+            transactions['drivy'] = insurance_fee - transactions['assistance']
+        else:
+            total_commission = price * 0.3
+            transactions = {
+                'driver': -price,
+                'owner': price - total_commission,
+                'insurance': total_commission * 0.5,
+                'assistance': duration * 100,
+            }
+            transactions['drivy'] = total_commission - (
+                transactions['insurance'] + transactions['assistance']
+            )
+        negative = transactions['drivy'] < 0
+
+        for actor in BatchPricing.ACTORS:
+            per_day = np.asarray(RENTAL_OPTIONS.per_day_column(actor), dtype=np.int64)
+            options_cost = per_day[options_mask] * duration
+            if actor == 'driver':
+                transactions[actor] = transactions[actor] - options_cost
+            else:
+                transactions[actor] = transactions[actor] + options_cost
+
+        return {
+            actor: transactions[actor].astype(np.int64)
+            for actor in BatchPricing.ACTORS
+        }, negative
+
+    @staticmethod
+    def _compute_python(price_per_day, price_per_km, duration, distance, options_mask):
+        amounts: Dict[str, List[int]] = {actor: [] for actor in BatchPricing.ACTORS}
+        for car_price, km_price, days, km, mask in zip(
+            price_per_day, price_per_km, duration, distance, options_mask
+        ):
+            price = Getaround.get_price_per_day(days, car_price) + km * km_price
+            if Getaround.CENTS:
+                transactions = Getaround.get_transactions_cents(price, days)
+            else:
+                transactions = Getaround.get_transactions(price, days)
+            Getaround.apply_options_mask(transactions, mask, days)
+            for actor in BatchPricing.ACTORS:
+                amounts[actor].append(int(transactions[actor]))
+        return amounts
+
+    @staticmethod
+    def _gather(column: Sequence[int], indexes: Sequence[int]) -> Sequence[int]:
+        if np is None:
+            return [column[index] for index in indexes]
+        return np.asarray(column)[np.asarray(indexes)]
+
+    @staticmethod
+    def to_actions(amounts: Dict[str, Sequence[int]], index: int) -> List:
+        """Format the amounts of one rental of the batch as array of actions
+        Args:
+            amounts (Dict[str, Sequence[int]]): result of BatchPricing.compute
+            index (int): index of the rental in the batch
+        Returns:
+            List: formatted array of actions with keys: who, type, amount
+        """
+        actions = []
+
+        for actor in BatchPricing.ACTORS:
+            amount = int(amounts[actor][index])
+            actions.append({
+                'who': actor,
+                'type': 'credit' if amount >= 0 else 'debit',
+                'amount': abs(amount),
+            })
+        return actions
+
+    @staticmethod
+    def iter_table(cars: CarTable, rentals: RentalTable, batch_size: int = 1 << 16) -> Iterator[Dict]:
+        """Lazily compute all rentals of a columnar table, by batches
+        Args:
+            cars (CarTable): cars the rentals have been resolved against
+            rentals (RentalTable): rentals to compute
+            batch_size (int): number of rentals priced at once
+        Yields:
+            Dict: Output of one rental, in the table order
+        """
+        duration = rentals.duration()
+        for start in range(0, len(rentals), batch_size):
+            end = min(start + batch_size, len(rentals))
+            amounts = BatchPricing.compute_columns(
+                cars.price_per_day,
+                cars.price_per_km,
+                rentals.car_index[start:end],
+                duration[start:end],
+                rentals.distance[start:end],
+                rentals.options_mask[start:end],
+            )
+            yield from BatchPricing.iter_outputs(rentals, amounts, start, end)
+
+    @staticmethod
+    def compute_columns(
+        car_price_per_day: Sequence[int],
+        car_price_per_km: Sequence[int],
+        car_index: Sequence[int],
+        duration: Sequence[int],
+        distance: Sequence[int],
+        options_mask: Sequence[int],
+    ) -> Dict[str, Sequence[int]]:
+        """Compute the banking transactions of a batch of rentals,
+        from the columns of a CarTable and of a RentalTable
+        Args:
+            car_price_per_day (Sequence[int]): price per day of all cars
+            car_price_per_km (Sequence[int]): price per km of all cars
+            car_index (Sequence[int]): car row of each rental of the batch
+            duration (Sequence[int]): duration of the rentals in days
+            distance (Sequence[int]): distance of the rentals in km
+            options_mask (Sequence[int]): options bitmask of the rentals
+        Returns:
+            Dict[str, Sequence[int]]: see BatchPricing.compute
+        """
+        return BatchPricing.compute(
+            BatchPricing._gather(car_price_per_day, car_index),
+            BatchPricing._gather(car_price_per_km, car_index),
+            duration,
+            distance,
+            options_mask,
+        )
+
+    @staticmethod
+    def iter_outputs(
+        rentals: RentalTable,
+        amounts: Dict[str, Sequence[int]],
+        start: int,
+        end: int,
+    ) -> Iterator[Dict]:
+        """Format the computed rows [start, end) of a rental table
+        Args:
+            rentals (RentalTable): rentals of the batch
+            amounts (Dict[str, Sequence[int]]): result of the batch
+            start (int): first row of the batch
+            end (int): row after the last one of the batch
+        Yields:
+            Dict: Output of one rental, in the table order
+        """
+        for index in range(end - start):
+            yield {
+                'id': rentals.ids[start + index],
+                'options': RENTAL_OPTIONS.to_options(
+                    rentals.options_mask[start + index], rentals.options_order[start + index]
+                ),
+                'actions': BatchPricing.to_actions(amounts, index),
+            }
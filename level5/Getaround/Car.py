@@ -8,6 +8,8 @@ class CarInit(TypedDict):
 
 
 class Car:
+    __slots__ = ('id', 'price_per_day', 'price_per_km')
+
     def __init__(self, props: CarInit) -> None:
         self.id = props['id']
         self.price_per_day = props['price_per_day']
@@ -0,0 +1,72 @@
+from array import array
+from typing import Dict, List
+
+from .Car import Car, CarInit
+
+
+class CarTable:
+    """Cars stored by columns (struct of arrays) instead of one object per car.
+    Columns are array.array, numpy can view them without copy (numpy.asarray)
+    """
+    __slots__ = ('ids', 'price_per_day', 'price_per_km', 'index')
+    COLUMNS = ('ids', 'price_per_day', 'price_per_km')
+
+    def __init__(self) -> None:
+        self.ids = array('q')
+        self.price_per_day = array('q')
+        self.price_per_km = array('q')
+        self.index: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, car: CarInit) -> None:
+        """Add a car at the end of the table
+        Args:
+            car (CarInit): car as found in the input
+        """
+        self.index[car['id']] = len(self.ids)
+        self.ids.append(car['id'])
+        self.price_per_day.append(car['price_per_day'])
+        self.price_per_km.append(car['price_per_km'])
+
+    def to_car(self, index: int) -> Car:
+        """Build the Car object of a row, for callers that need objects
+        Args:
+            index (int): row of the car in the table
+        Returns:
+            Car: the corresponding car
+        """
+        return Car({
+            'id': self.ids[index],
+            'price_per_day': self.price_per_day[index],
+            'price_per_km': self.price_per_km[index],
+        })
+
+    def to_cars(self) -> Dict[int, Car]:
+        """
+        Returns:
+            Dict[int, Car]: Car objects of all rows, by id
+        """
+        return {self.ids[index]: self.to_car(index) for index in range(len(self.ids))}
+
+    def columns(self) -> List[array]:
+        """
+        Returns:
+            List[array]: the columns, in COLUMNS order
+        """
+        return [getattr(self, name) for name in self.COLUMNS]
+
+    @classmethod
+    def from_columns(cls, columns: List[array]) -> 'CarTable':
+        """Rebuild a table from the columns of another one (see columns)
+        Args:
+            columns (List[array]): the columns, in COLUMNS order
+        Returns:
+            CarTable: the table
+        """
+        table = cls()
+        for name, column in zip(cls.COLUMNS, columns):
+            setattr(table, name, column)
+        table.index = {car_id: index for index, car_id in enumerate(table.ids)}
+        return table
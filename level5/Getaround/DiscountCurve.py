@@ -0,0 +1,81 @@
+from typing import Dict, Iterable, List, Tuple
+
+# (discount ratio, applied after this number of days)
+DEFAULT_DISCOUNTS = (
+    (0.5, 10),
+    (0.7, 4),
+    (0.9, 1),
+    (1.0, 0),
+)
+
+
+class DiscountCurve:
+    """Discount schedule compiled once, with the price for each duration cached
+    per car price: after the first rental of a car price and duration,
+    the price is a single table lookup.
+    The prices are computed with the same float operations, in the same order,
+    as the historic get_price_per_day, so truncation gives the same cents.
+    Tables are bounded: longer durations and car prices beyond MAX_TABLES are
+    computed on each call.
+    """
+    # Longest duration kept in a table, in days
+    MAX_TABLE_DAYS = 366
+    # Number of car prices with a table
+    MAX_TABLES = 1 << 10
+
+    def __init__(self, discounts: Iterable[Tuple[float, int]] = DEFAULT_DISCOUNTS) -> None:
+        """
+        Args:
+            discounts (Iterable[Tuple[float, int]]): (ratio, min_days) tiers,
+                the ratio applies to the days after min_days, one tier
+                has to start at 0 day
+        """
+        self.discounts = tuple(
+            sorted(discounts, key=lambda discount: discount[1], reverse=True)
+        )
+        if not self.discounts or self.discounts[-1][1] != 0:
+            raise ValueError('Discounts need a tier starting at 0 day')
+        if len({min_days for _, min_days in self.discounts}) != len(self.discounts):
+            raise ValueError('Discounts tiers have to start on different days')
+        self._prices: Dict[int, List[int]] = {}
+
+    def compute(self, duration: int, car_price: int) -> int:
+        """Compute the price for the rental duration, without the cache
+        Args:
+            duration (int): duration of the rental in days
+            car_price (int): car price per day in cents
+        Returns:
+            int: computed price for the rental duration
+        """
+        price_per_day = 0
+
+        for discount_ratio, min_days in self.discounts:
+            if duration <= min_days:
+                continue
+            discounted_days = duration - min_days
+            duration -= discounted_days
+            price_per_day += discounted_days * discount_ratio * car_price
+        return int(price_per_day)
+
+    def get_price(self, duration: int, car_price: int) -> int:
+        """Get the price for the rental duration from the table of the car price,
+        extending the table up to the duration if needed
+        Args:
+            duration (int): duration of the rental in days
+            car_price (int): car price per day in cents
+        Returns:
+            int: computed price for the rental duration
+        """
+        if duration > self.MAX_TABLE_DAYS:
+            return self.compute(duration, car_price)
+        prices = self._prices.get(car_price)
+        if prices is None:
+            if len(self._prices) >= self.MAX_TABLES:
+                return self.compute(duration, car_price)
+            prices = self._prices[car_price] = [0]
+        if duration >= len(prices):
+            prices.extend(
+                self.compute(days, car_price)
+                for days in range(len(prices), duration + 1)
+            )
+        return prices[duration]
@@ -1,18 +1,28 @@
-from typing import Dict, List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from .Car import Car
+from .DiscountCurve import DiscountCurve
+from .PricingCache import PricingCache
+from .RentalOptions import RENTAL_OPTIONS
 from .RentalRequest import RentalRequest
 
 
 class Getaround:
+    DISCOUNT_CURVE = DiscountCurve()
+    # Compute the transactions with get_transactions_cents instead of floats
+    CENTS = False
+
     def __init__(
         self,
         cars: Dict[int, Car],
-        rentals: Dict[int, RentalRequest]
+        rentals: Dict[int, RentalRequest],
+        cache_size: int = 1 << 16,
     ):
         self.output = list()
         self.cars = cars
         self.rentals = rentals
+        self.cache = PricingCache(cache_size)
+        self._rentals_by_car: Optional[Dict[int, Set[int]]] = None
 
     @staticmethod
     def get_price_per_day(duration: int, car_price: int) -> int:
@@ -25,21 +35,16 @@ class Getaround:
         Returns:
             int: computed price for the rental duration
         """
-        price_per_day = 0
-        discounts = [
-            (0.5, 10),
-            (0.7, 4),
-            (0.9, 1),
-            (1.0, 0),
-        ]
-
-        for discount_ratio, min_days in discounts:
-            if duration <= min_days:
-                continue
-            discounted_days = duration - min_days
-            duration -= discounted_days
-            price_per_day += discounted_days * discount_ratio * car_price
-        return int(price_per_day)
+        return Getaround.DISCOUNT_CURVE.get_price(duration, car_price)
+
+    @staticmethod
+    def set_discounts(discounts: Iterable[Tuple[float, int]]) -> None:
+        """Replace the discount schedule used by get_price_per_day
+        Args:
+            discounts (Iterable[Tuple[float, int]]): (ratio, min_days) tiers,
+                see DiscountCurve
+        """
+        Getaround.DISCOUNT_CURVE = DiscountCurve(discounts)
 
     @staticmethod
     def get_price(rental: RentalRequest, car: Car) -> int:
@@ -89,9 +94,39 @@ class Getaround:
             'drivy': drivy_fee,
         }
 
+    @staticmethod
+    def get_transactions_cents(rental_price: int, duration: int) -> Dict[str, int]:
+        """Compute all the banking transactions like get_transactions, with integer
+        arithmetic only: each amount is directly the truncated value in cents,
+        which is what the float amounts give once truncated (see check_cents.py)
+        Args:
+            duration (int): duration of the rental in days
+            rental_price (int): price of the rental
+        Returns:
+            Dict: Dict with keys: driver, owner, insurance, assistance, drivy
+        """
+        # 30% of commission, split in half: 15% of the price each
+        insurance_fee = rental_price * 3 // 20
+        assistance_fee = duration * 100
+        drivy_fee = insurance_fee - assistance_fee
+
+        if drivy_fee < 0:
+            raise Exception(
+                f'Undefined behavior, drivy_fee are negative: {drivy_fee = }'
+            )
+
+        return {
+            'driver': -rental_price,
+            'owner': rental_price * 7 // 10,
+            'insurance': insurance_fee,
+            'assistance': assistance_fee,
+            'drivy': drivy_fee,
+        }
+
     @staticmethod
     def apply_rental_options(transactions: Dict[str, float], rental: RentalRequest) -> None:
-        """Apply the fees according to the selected options of the rental
+        """Apply the fees according to the selected options of the rental,
+        as precompiled for its options mask by RENTAL_OPTIONS. By default:
             - GPS: 500/day, all the money goes to the owner
             - Baby Seat: 200/day, all the money goes to the owner
             - Additional Insurance: 1000/day, all the money goes to Getaround
@@ -99,19 +134,20 @@ class Getaround:
             transactions (Dict[str, float]): commissions previously computed (without options)
             rental (RentalRequest): corresponding rental
         """
-        for option in rental.options:
-            if option == 'gps':
-                option_cost = 500 * rental.duration
-                transactions['owner'] += option_cost
-            elif option == 'baby_seat':
-                option_cost = 200 * rental.duration
-                transactions['owner'] += option_cost
-            elif option == 'additional_insurance':
-                option_cost = 1000 * rental.duration
-                transactions['drivy'] += option_cost
-            else:
-                raise Exception(f'Unexpected option {option}')
-            transactions['driver'] -= option_cost
+        Getaround.apply_options_mask(transactions, rental.options_mask, rental.duration)
+
+    @staticmethod
+    def apply_options_mask(transactions: Dict[str, float], options_mask: int, duration: int) -> None:
+        """Apply the fees of an options mask (see apply_rental_options)
+        Args:
+            transactions (Dict[str, float]): commissions previously computed (without options)
+            options_mask (int): options bitmask of the rental
+            duration (int): duration of the rental in days
+        """
+        driver_per_day, credits_per_day = RENTAL_OPTIONS.mask_fees[options_mask]
+        for beneficiary, price_per_day in credits_per_day:
+            transactions[beneficiary] += price_per_day * duration
+        transactions['driver'] -= driver_per_day * duration
 
     @staticmethod
     def transactions_to_action(transactions: Dict[str, float]) -> List:
@@ -135,6 +171,8 @@ class Getaround:
 
     def compute_one_rental(self, rental_id: int) -> Dict:
         """Compute one rental, referred by its ID.
+        The actions are reused from self.cache for identical pricing inputs,
+        and copied so each output can be modified on its own
         Returns:
             Dict: Output for the matching rental containing:
             - the rental id,
@@ -143,22 +181,133 @@ class Getaround:
         rental = self.rentals[rental_id]
         car = self.cars[rental.car_id]
 
-        price = self.get_price(rental, car)
-        transactions = self.get_transactions(price, rental.duration)
-        self.apply_rental_options(transactions, rental)
-        actions = self.transactions_to_action(transactions)
+        self.cache.ensure_config(
+            (Getaround.DISCOUNT_CURVE, RENTAL_OPTIONS.mask_fees, Getaround.CENTS)
+        )
+        key = (
+            car.price_per_day, car.price_per_km,
+            rental.duration, rental.distance, rental.options_mask,
+        )
+        actions = self.cache.get(key)
+        if actions is None:
+            price = self.get_price(rental, car)
+            if Getaround.CENTS:
+                transactions = self.get_transactions_cents(price, rental.duration)
+            else:
+                transactions = self.get_transactions(price, rental.duration)
+            self.apply_rental_options(transactions, rental)
+            actions = self.transactions_to_action(transactions)
+            self.cache.put(key, actions)
         return {
             'id': rental_id,
-            'options': rental.options,
-            'actions': actions,
+            'options': RENTAL_OPTIONS.to_options(rental.options_mask, rental.options_order),
+            'actions': [action.copy() for action in actions],
         }
 
+    def iter_rentals(self) -> Iterator[Dict]:
+        """Lazily compute all rentals (by calling self.compute_one_rental),
+        without keeping the results alive once they are consumed
+        Yields:
+            Dict: Output of one rental, in the rentals order
+        """
+        for rental_id in self.rentals.keys():
+            yield self.compute_one_rental(rental_id)
+
     def compute_rentals(self) -> List:
-        """Compute all rentals (by calling self.compute_one_rental)
+        """Compute all rentals (by calling self.iter_rentals)
         Returns:
             List: All rentals
         """
-        for rental_id in self.rentals.keys():
-            price = self.compute_one_rental(rental_id)
-            self.output.append(price)
+        self.output = list(self.iter_rentals())
         return self.output
+
+    @property
+    def rentals_by_car(self) -> Dict[int, Set[int]]:
+        """Reverse index from car id to the ids of its rentals, built on first use
+        and kept up to date by the update methods below
+        """
+        if self._rentals_by_car is None:
+            self._rentals_by_car = {}
+            for rental in self.rentals.values():
+                self._rentals_by_car.setdefault(rental.car_id, set()).add(rental.id)
+        return self._rentals_by_car
+
+    def _reprice(self, rental_ids: Iterable[int], change: Callable[[], None]) -> Dict[int, Optional[Dict]]:
+        """Apply a change and re-compute only the given rentals
+        Args:
+            rental_ids (Iterable[int]): rentals affected by the change
+            change (Callable[[], None]): applies the change
+        Returns:
+            Dict[int, Optional[Dict]]: new output of each rental whose output
+            changed, None for removed rentals
+        """
+        rental_ids = list(rental_ids)
+        before = {
+            rental_id: self.compute_one_rental(rental_id)
+            for rental_id in rental_ids if rental_id in self.rentals
+        }
+        change()
+        changes: Dict[int, Optional[Dict]] = {}
+        for rental_id in rental_ids:
+            after = None
+            if rental_id in self.rentals:
+                after = self.compute_one_rental(rental_id)
+            if after != before.get(rental_id):
+                changes[rental_id] = after
+        return changes
+
+    def update_car(self, car: Car) -> Dict[int, Optional[Dict]]:
+        """Add or replace a car, and re-compute its rentals.
+        Pass a new Car object: a car mutated in place has no former prices to compare
+        Args:
+            car (Car): new version of the car
+        Returns:
+            Dict[int, Optional[Dict]]: new output of the rentals that changed
+        """
+        def change() -> None:
+            self.cars[car.id] = car
+        return self._reprice(sorted(self.rentals_by_car.get(car.id, ())), change)
+
+    def add_rental(self, rental: RentalRequest) -> Dict[int, Optional[Dict]]:
+        """Add a rental and compute it
+        Args:
+            rental (RentalRequest): new rental, its car has to exist
+        Returns:
+            Dict[int, Optional[Dict]]: output of the new rental
+        """
+        if rental.id in self.rentals:
+            raise ValueError(f'Rental {rental.id} already exists')
+        if rental.car_id not in self.cars:
+            raise KeyError(rental.car_id)
+
+        def change() -> None:
+            self.rentals[rental.id] = rental
+            self.rentals_by_car.setdefault(rental.car_id, set()).add(rental.id)
+        return self._reprice((rental.id,), change)
+
+    def remove_rental(self, rental_id: int) -> Dict[int, Optional[Dict]]:
+        """Remove a rental
+        Args:
+            rental_id (int): id of the rental
+        Returns:
+            Dict[int, Optional[Dict]]: the rental id with None as output
+        """
+        rental = self.rentals[rental_id]
+
+        def change() -> None:
+            # Built before the removal if needed, so it still has the rental
+            rentals_by_car = self.rentals_by_car
+            del self.rentals[rental_id]
+            rentals_by_car.get(rental.car_id, set()).discard(rental_id)
+        return self._reprice((rental_id,), change)
+
+    def add_option(self, rental_id: int, option: str) -> Dict[int, Optional[Dict]]:
+        """Select an option for a rental, and re-compute it
+        Args:
+            rental_id (int): id of the rental
+            option (str): option to add
+        Returns:
+            Dict[int, Optional[Dict]]: new output of the rental if it changed
+        """
+        rental = self.rentals[rental_id]
+        return self._reprice((rental_id,), lambda: rental.add_option(option))
@@ -0,0 +1,80 @@
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+
+class PricingCache:
+    """Bounded LRU cache of rental actions, keyed by the pricing inputs
+    (car prices, duration, distance, options mask). Car prices are part of the
+    key, so a price change never reuses the actions of the former price.
+    The cached actions lists are shared between rentals: they must not be mutated
+    (Getaround.compute_one_rental outputs copies of them)
+    """
+
+    def __init__(self, maxsize: int = 1 << 16) -> None:
+        """
+        Args:
+            maxsize (int): maximum number of cached actions lists, 0 disables the cache
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: 'OrderedDict[Hashable, List]' = OrderedDict()
+        self._config: Tuple[Any, ...] = ()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def ensure_config(self, config: Tuple[Any, ...]) -> None:
+        """Clear the cache if the pricing rules (discounts, options...) changed
+        since the cached actions were computed
+        Args:
+            config (Tuple[Any, ...]): objects defining the pricing rules,
+                compared by identity
+        """
+        if len(config) != len(self._config) or any(
+            current is not cached for current, cached in zip(config, self._config)
+        ):
+            self.clear()
+            self._config = config
+
+    def get(self, key: Hashable) -> Optional[List]:
+        """
+        Args:
+            key (Hashable): pricing inputs of the rental
+        Returns:
+            Optional[List]: cached actions, None if missing
+        """
+        actions = self._entries.get(key)
+        if actions is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return actions
+
+    def put(self, key: Hashable, actions: List) -> None:
+        """
+        Args:
+            key (Hashable): pricing inputs of the rental
+            actions (List): computed actions of the rental
+        """
+        if self.maxsize <= 0:
+            return
+        self._entries[key] = actions
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def info(self) -> Dict[str, int]:
+        """
+        Returns:
+            Dict[str, int]: hits, misses, current size and maxsize of the cache
+        """
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
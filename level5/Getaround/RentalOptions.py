@@ -1,4 +1,4 @@
-from typing import TypedDict, Literal
+from typing import Dict, Iterable, List, Literal, NamedTuple, Tuple, TypedDict
 
 
 RentalOptionType = Literal['gps', 'baby_seat', 'additional_insurance']
@@ -10,7 +10,187 @@ class RentalOptionsInit(TypedDict):
     type: RentalOptionType
 
 
+class RentalOptionFee(NamedTuple):
+    mask: int
+    price_per_day: int
+    beneficiary: str
+
+
+class RentalOptionDefinition(TypedDict):
+    type: str
+    price_per_day: int
+    beneficiary: str
+
+
+# Driver debit per day, and credit per day of each beneficiary
+MaskFees = Tuple[int, Tuple[Tuple[str, int], ...]]
+
+
+class RentalOptionRegistry:
+    """Definitions of the rental options. Each option gets a bit of the options
+    mask, and the fees of every possible mask are precompiled, so pricing the
+    options of a rental is one lookup in self.mask_fees
+    """
+    # Options masks are stored on 16 bits (see RentalTable.options_mask)
+    MAX_OPTIONS = 16
+    # Options orders are stored on 64 bits (see RentalTable.options_order)
+    ORDER_BITS = 4
+    BENEFICIARIES = ('owner', 'insurance', 'assistance', 'drivy')
+
+    def __init__(self, definitions: Iterable[RentalOptionDefinition] = ()) -> None:
+        self.fees: Dict[str, RentalOptionFee] = {}
+        self.mask_fees: List[MaskFees] = [(0, ())]
+        self._per_day_columns: Dict[str, List[int]] = {}
+        self.load(definitions)
+
+    def load(self, definitions: Iterable[RentalOptionDefinition]) -> None:
+        """Replace all options by new definitions, masks follow their order
+        Args:
+            definitions (Iterable[RentalOptionDefinition]): options to register
+        """
+        self.fees = {}
+        self._compile()
+        for definition in definitions:
+            self.register(definition)
+
+    def register(self, definition: RentalOptionDefinition) -> None:
+        """Add an option, on the next free bit of the options mask
+        Args:
+            definition (RentalOptionDefinition): option to register
+        """
+        if definition['type'] in self.fees:
+            raise ValueError(f"Option {definition['type']} is already registered")
+        if definition['beneficiary'] not in self.BENEFICIARIES:
+            raise ValueError(
+                f"Option beneficiary has to be one of {self.BENEFICIARIES}"
+            )
+        if len(self.fees) == self.MAX_OPTIONS:
+            raise ValueError(f'At most {self.MAX_OPTIONS} options can be registered')
+        self.fees[definition['type']] = RentalOptionFee(
+            1 << len(self.fees), definition['price_per_day'], definition['beneficiary']
+        )
+        self._compile()
+
+    def definitions(self) -> List[RentalOptionDefinition]:
+        """
+        Returns:
+            List[RentalOptionDefinition]: registered options, in mask order
+        """
+        return [
+            {'type': option, 'price_per_day': fee.price_per_day,
+             'beneficiary': fee.beneficiary}
+            for option, fee in self.fees.items()
+        ]
+
+    def _compile(self) -> None:
+        self._per_day_columns = {}
+        self.mask_fees = []
+        for mask in range(1 << len(self.fees)):
+            credits: Dict[str, int] = {}
+            for fee in self.fees.values():
+                if mask & fee.mask:
+                    credits[fee.beneficiary] = (
+                        credits.get(fee.beneficiary, 0) + fee.price_per_day
+                    )
+            self.mask_fees.append((sum(credits.values()), tuple(credits.items())))
+
+    def per_day_column(self, actor: str) -> List[int]:
+        """Fees per day of an actor for every options mask, driver included,
+        to price masks by columns
+        Args:
+            actor (str): debited driver or credited beneficiary
+        Returns:
+            List[int]: fees per day, indexed by options mask
+        """
+        if actor not in self._per_day_columns:
+            if actor == 'driver':
+                column = [driver_per_day for driver_per_day, _ in self.mask_fees]
+            else:
+                column = [dict(credits).get(actor, 0) for _, credits in self.mask_fees]
+            self._per_day_columns[actor] = column
+        return self._per_day_columns[actor]
+
+    def select(self, mask: int, order: int, option: str) -> Tuple[int, int]:
+        """Add an option after the options already selected for a rental.
+            The bitmask prices the options, the order keeps them in the order
+            they were selected: ORDER_BITS per option giving its bit, 0 while
+            the options are in mask order
+        Args:
+            mask (int): options bitmask of the rental
+            order (int): options order of the rental
+            option (str): option to add
+        Returns:
+            Tuple[int, int]: new options bitmask and order, raises ValueError
+            if the option is already selected
+        """
+        if option not in self.fees:
+            raise Exception(f'Unexpected option {option}')
+        bit = self.fees[option].mask
+        if mask & bit:
+            raise ValueError(f'Option {option} is selected twice')
+        if order == 0 and bit > mask:
+            return mask | bit, 0
+        positions = self._positions(mask, order)
+        positions.append(bit.bit_length() - 1)
+        order = 0
+        for rank, position in enumerate(positions):
+            order |= position << (rank * self.ORDER_BITS)
+        return mask | bit, order
+
+    def _positions(self, mask: int, order: int) -> List[int]:
+        # Bits of the selected options, in selection order
+        if order == 0:
+            return [position for position in range(len(self.fees)) if mask >> position & 1]
+        return [
+            order >> (rank * self.ORDER_BITS) & ((1 << self.ORDER_BITS) - 1)
+            for rank in range(bin(mask).count('1'))
+        ]
+
+    def encode(self, options: Iterable[str]) -> Tuple[int, int]:
+        """Encode a list of options as a bitmask and an order (see select)
+        Args:
+            options (Iterable[str]): options of a rental, each one at most once
+        Returns:
+            Tuple[int, int]: options bitmask and order
+        """
+        mask = order = 0
+        for option in options:
+            mask, order = self.select(mask, order, option)
+        return mask, order
+
+    def to_mask(self, options: Iterable[str]) -> int:
+        """Encode a list of options as a bitmask
+        Args:
+            options (Iterable[str]): options of a rental, each one at most once
+        Returns:
+            int: bitwise or of the options masks
+        """
+        return self.encode(options)[0]
+
+    def to_options(self, mask: int, order: int = 0) -> List[str]:
+        """Decode a bitmask into its list of options
+        Args:
+            mask (int): bitwise or of the options masks
+            order (int): order of the options (see select), mask order if 0
+        Returns:
+            List[str]: options of the rental
+        """
+        if order == 0:
+            return [option for option, fee in self.fees.items() if mask & fee.mask]
+        options = list(self.fees)
+        return [options[position] for position in self._positions(mask, order)]
+
+
+RENTAL_OPTIONS = RentalOptionRegistry([
+    {'type': 'gps', 'price_per_day': 500, 'beneficiary': 'owner'},
+    {'type': 'baby_seat', 'price_per_day': 200, 'beneficiary': 'owner'},
+    {'type': 'additional_insurance', 'price_per_day': 1000, 'beneficiary': 'drivy'},
+])
+
+
 class RentalOptions:
+    __slots__ = ('id', 'rental_id', 'type')
+
     def __init__(self, props: RentalOptionsInit) -> None:
         self.id = props['id']
         self.rental_id = props['rental_id']
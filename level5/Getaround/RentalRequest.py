@@ -1,6 +1,8 @@
-from datetime import datetime
-from typing import TypedDict, List
-from .RentalOptions import RentalOptionType
+from array import array
+from datetime import date
+from functools import lru_cache
+from typing import Iterable, TypedDict, Tuple
+from .RentalOptions import RENTAL_OPTIONS
 
 
 class RentalRequestInit(TypedDict):
@@ -12,22 +14,126 @@ class RentalRequestInit(TypedDict):
 
 
 class RentalRequest:
+    __slots__ = (
+        'id', 'car_id', 'start_date', 'end_date', 'distance', 'options_mask',
+        'options_order', 'duration',
+    )
+
     def __init__(self, props: RentalRequestInit) -> None:
         self.id = props['id']
         self.car_id = props['car_id']
         self.start_date = self.parse_date(props['start_date'])
         self.end_date = self.parse_date(props['end_date'])
         self.distance = props['distance']
-        self.options: List[RentalOptionType] = []
+        self.options_mask = 0
+        self.options_order = 0
 
         if (self.start_date > self.end_date):
             raise ValueError('start_date has to be earlier than end_date')
         self.duration = (self.end_date - self.start_date).days + 1
 
-    @staticmethod
-    def parse_date(date: str):
-        return (
-            datetime
-            .strptime(date, '%Y-%m-%d')
-            .date()
+    @classmethod
+    def from_days(
+        cls,
+        rental_id: int,
+        car_id: int,
+        start_day: int,
+        end_day: int,
+        distance: int,
+        options_mask: int = 0,
+        options_order: int = 0,
+    ) -> 'RentalRequest':
+        """Build a rental from day ordinals (see RentalTable), without parsing dates
+        Args:
+            rental_id (int): id of the rental
+            car_id (int): id of the car
+            start_day (int): day ordinal of the start date
+            end_day (int): day ordinal of the end date
+            distance (int): distance in km
+            options_mask (int): options bitmask (see RENTAL_OPTIONS)
+            options_order (int): order of the options (see RENTAL_OPTIONS.select)
+        Returns:
+            RentalRequest: the rental
+        """
+        if (start_day > end_day):
+            raise ValueError('start_date has to be earlier than end_date')
+        rental = cls.__new__(cls)
+        rental.id = rental_id
+        rental.car_id = car_id
+        rental.start_date = date.fromordinal(start_day)
+        rental.end_date = date.fromordinal(end_day)
+        rental.distance = distance
+        rental.options_mask = options_mask
+        rental.options_order = options_order
+        rental.duration = end_day - start_day + 1
+        return rental
+
+    @property
+    def options(self) -> Tuple[str, ...]:
+        """Options of the rental in the order they were selected, stored as a
+        bitmask and an order (see RENTAL_OPTIONS.select). Read-only: options
+        are selected with add_option, or replaced by assigning this property
+        """
+        return tuple(RENTAL_OPTIONS.to_options(self.options_mask, self.options_order))
+
+    @options.setter
+    def options(self, options: Iterable[str]) -> None:
+        self.options_mask, self.options_order = RENTAL_OPTIONS.encode(options)
+
+    def add_option(self, option: str) -> None:
+        """Select an option for the rental, raises ValueError if it is already selected
+        Args:
+            option (str): option to add
+        """
+        self.options_mask, self.options_order = RENTAL_OPTIONS.select(
+            self.options_mask, self.options_order, option
         )
+
+    @staticmethod
+    @lru_cache(maxsize=1 << 16)
+    def parse_date(date_string: str) -> date:
+        """Parse a date formatted as %Y-%m-%d, where month and day may not be
+        zero-padded (e.g. 2015-12-8). Memoized as inputs reuse few distinct dates
+        Args:
+            date_string (str): date to parse
+        Returns:
+            date: the parsed date, raises ValueError if invalid
+        """
+        year, month, day = date_string.split('-')
+        # Same digits as strptime: int alone would accept signs and whitespace
+        if not (
+            len(year) == 4 and 1 <= len(month) <= 2 and 1 <= len(day) <= 2
+            and year.isdigit() and month.isdigit() and day.isdigit()
+        ):
+            raise ValueError(f'time data {date_string!r} does not match format %Y-%m-%d')
+        return date(int(year), int(month), int(day))
+
+    @staticmethod
+    def parse_day(date_string: str) -> int:
+        """Parse a date (see parse_date) as a day ordinal (see date.toordinal)
+        Args:
+            date_string (str): date to parse
+        Returns:
+            int: the day ordinal of the date
+        """
+        return RentalRequest.parse_date(date_string).toordinal()
+
+    @staticmethod
+    def get_durations(start_dates: Iterable[str], end_dates: Iterable[str]) -> array:
+        """Compute the duration in days of many rentals at once, from day ordinals
+        Args:
+            start_dates (Iterable[str]): start date of each rental
+            end_dates (Iterable[str]): end date of each rental
+        Returns:
+            array: duration of each rental, raises ValueError if a rental
+            ends before it starts
+        """
+        parse_day = RentalRequest.parse_day
+        durations = array('l')
+
+        for start_date, end_date in zip(start_dates, end_dates):
+            duration = parse_day(end_date) - parse_day(start_date) + 1
+            if duration < 1:
+                raise ValueError('start_date has to be earlier than end_date')
+            durations.append(duration)
+        return durations
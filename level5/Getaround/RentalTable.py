@@ -0,0 +1,155 @@
+from array import array
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from .CarTable import CarTable
+from .RentalOptions import RENTAL_OPTIONS
+from .RentalRequest import RentalRequest, RentalRequestInit
+
+
+class RentalTable:
+    """Rentals stored by columns (struct of arrays) instead of one object per rental:
+        - dates are kept as day ordinals (date.toordinal)
+        - options are kept as a bitmask and an order (see RENTAL_OPTIONS.select)
+    Columns are array.array, numpy can view them without copy (numpy.asarray)
+    """
+    __slots__ = (
+        'ids', 'car_index', 'start_day', 'end_day', 'distance', 'options_mask',
+        'options_order', '_index', '_resolved',
+    )
+    COLUMNS = (
+        'ids', 'car_index', 'start_day', 'end_day', 'distance', 'options_mask', 'options_order',
+    )
+
+    def __init__(self) -> None:
+        self.ids = array('q')
+        # Rows after self._resolved hold car ids until resolve_cars is called
+        self.car_index = array('q')
+        self.start_day = array('l')
+        self.end_day = array('l')
+        self.distance = array('q')
+        self.options_mask = array('H')
+        self.options_order = array('Q')
+        self._index: Optional[Dict[int, int]] = None
+        self._resolved = 0
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def append(self, rental: RentalRequestInit) -> None:
+        """Add a rental at the end of the table, without any option
+        Args:
+            rental (RentalRequestInit): rental as found in the input
+        """
+        start_day = RentalRequest.parse_day(rental['start_date'])
+        end_day = RentalRequest.parse_day(rental['end_date'])
+        if (start_day > end_day):
+            raise ValueError('start_date has to be earlier than end_date')
+
+        if self._index is not None:
+            self._index[rental['id']] = len(self.ids)
+        elif self.ids and self.ids[-1] >= rental['id']:
+            # Ids are not increasing anymore, bisect cannot be used
+            self._index = {rental_id: index for index, rental_id in enumerate(self.ids)}
+            self._index[rental['id']] = len(self.ids)
+        self.ids.append(rental['id'])
+        self.car_index.append(rental['car_id'])
+        self.start_day.append(start_day)
+        self.end_day.append(end_day)
+        self.distance.append(rental['distance'])
+        self.options_mask.append(0)
+        self.options_order.append(0)
+
+    def index_of(self, rental_id: int) -> int:
+        """Find the row of a rental, by bisection while ids are increasing
+        Args:
+            rental_id (int): id of the rental
+        Returns:
+            int: row of the rental in the table, raises KeyError if not found
+        """
+        if self._index is not None:
+            return self._index[rental_id]
+        index = bisect_left(self.ids, rental_id)
+        if index == len(self.ids) or self.ids[index] != rental_id:
+            raise KeyError(rental_id)
+        return index
+
+    def add_option(self, index: int, option: str) -> None:
+        """Select an option for the rental of a row, raises ValueError if it is already selected
+        Args:
+            index (int): row of the rental in the table
+            option (str): option to add
+        """
+        self.options_mask[index], self.options_order[index] = RENTAL_OPTIONS.select(
+            self.options_mask[index], self.options_order[index], option
+        )
+
+    def resolve_cars(self, cars: CarTable) -> None:
+        """Turn the car ids of the rentals into rows of the car table,
+        once all cars are known
+        Args:
+            cars (CarTable): cars of the rentals
+        """
+        for index in range(self._resolved, len(self.car_index)):
+            self.car_index[index] = cars.index[self.car_index[index]]
+        self._resolved = len(self.car_index)
+
+    def duration(self) -> array:
+        """Compute the duration in days of all rentals
+        Returns:
+            array: duration column
+        """
+        return array('l', (
+            end_day - start_day + 1
+            for start_day, end_day in zip(self.start_day, self.end_day)
+        ))
+
+    def to_request(self, index: int, cars: CarTable) -> RentalRequest:
+        """Build the RentalRequest object of a row, for callers that need objects
+        Args:
+            index (int): row of the rental in the table
+            cars (CarTable): cars the rentals have been resolved against
+        Returns:
+            RentalRequest: the corresponding rental, with its options
+        """
+        return RentalRequest.from_days(
+            self.ids[index],
+            cars.ids[self.car_index[index]],
+            self.start_day[index],
+            self.end_day[index],
+            self.distance[index],
+            self.options_mask[index],
+            self.options_order[index],
+        )
+
+    def to_requests(self, cars: CarTable) -> Dict[int, RentalRequest]:
+        """
+        Args:
+            cars (CarTable): cars the rentals have been resolved against
+        Returns:
+            Dict[int, RentalRequest]: RentalRequest objects of all rows, by id
+        """
+        return {self.ids[index]: self.to_request(index, cars) for index in range(len(self.ids))}
+
+    def columns(self) -> List[array]:
+        """
+        Returns:
+            List[array]: the columns, in COLUMNS order, cars must be resolved
+        """
+        return [getattr(self, name) for name in self.COLUMNS]
+
+    @classmethod
+    def from_columns(cls, columns: List[array]) -> 'RentalTable':
+        """Rebuild a resolved table from the columns of another one (see columns)
+        Args:
+            columns (List[array]): the columns, in COLUMNS order
+        Returns:
+            RentalTable: the table
+        """
+        table = cls()
+        for name, column in zip(cls.COLUMNS, columns):
+            setattr(table, name, column)
+        if any(table.ids[index] >= table.ids[index + 1] for index in range(len(table.ids) - 1)):
+            table._index = {rental_id: index for index, rental_id in enumerate(table.ids)}
+        table._resolved = len(table.ids)
+        return table
@@ -0,0 +1,126 @@
+import argparse
+from typing import Final, Iterable, Iterator, List, Optional, Tuple
+
+from Getaround.BatchPricing import BatchPricing, np
+from Getaround.Getaround import Getaround
+from Getaround.RentalOptions import RENTAL_OPTIONS
+
+ENGINES: Final = ('scalar', 'batch')
+
+
+def _scalar_actions(price: int, duration: int, options_mask: int, cents: bool) -> Optional[List]:
+    try:
+        if cents:
+            transactions = Getaround.get_transactions_cents(price, duration)
+        else:
+            transactions = Getaround.get_transactions(price, duration)
+    except Exception:
+        return None
+    Getaround.apply_options_mask(transactions, options_mask, duration)
+    return Getaround.transactions_to_action(transactions)
+
+
+def _iter_mismatches_numpy(
+    max_price: int,
+    max_duration: int,
+    chunk_size: int,
+) -> Iterator[Tuple[int, int, int]]:
+    for start in range(0, max_price + 1, chunk_size):
+        price = np.arange(start, min(start + chunk_size, max_price + 1), dtype=np.int64)
+        for duration in range(1, max_duration + 1):
+            durations = np.full(len(price), duration, dtype=np.int64)
+            for options_mask in range(len(RENTAL_OPTIONS.mask_fees)):
+                masks = np.full(len(price), options_mask, dtype=np.int64)
+                floats, float_negative = BatchPricing.compute_transactions(
+                    price, durations, masks, False)
+                cents, cents_negative = BatchPricing.compute_transactions(
+                    price, durations, masks, True)
+                differs = float_negative != cents_negative
+                for actor in BatchPricing.ACTORS:
+                    differs |= ~float_negative & (floats[actor] != cents[actor])
+                for index in np.flatnonzero(differs):
+                    yield (int(price[index]), duration, options_mask)
+
+
+def _iter_mismatches_scalar(max_price: int, max_duration: int) -> Iterator[Tuple[int, int, int]]:
+    for duration in range(1, max_duration + 1):
+        for options_mask in range(len(RENTAL_OPTIONS.mask_fees)):
+            for price in range(max_price + 1):
+                if (
+                    _scalar_actions(price, duration, options_mask, False)
+                    != _scalar_actions(price, duration, options_mask, True)
+                ):
+                    yield (price, duration, options_mask)
+
+
+def iter_mismatches(
+    max_price: int,
+    max_duration: int,
+    engines: Iterable[str] = ENGINES,
+    chunk_size: int = 1 << 20,
+) -> Iterator[Tuple[str, int, int, int]]:
+    """Compare the float and the integer (cents) transactions of every rental
+    price from 0 to max_price, duration from 1 to max_duration, and options mask.
+        The scalar engine compares Getaround.get_transactions with
+        Getaround.get_transactions_cents, the batch engine the two paths of
+        BatchPricing.compute_transactions (skipped without numpy, the batch
+        engine then uses the scalar staticmethods)
+    Args:
+        max_price (int): highest rental price checked, in cents
+        max_duration (int): longest rental duration checked, in days
+        engines (Iterable[str]): engines checked, among ENGINES
+        chunk_size (int): number of prices checked at once with numpy
+    Yields:
+        Tuple[str, int, int, int]: (engine, price, duration, options_mask)
+        where the actions or the negative drivy_fee exception differ
+    """
+    for engine in engines:
+        if engine == 'scalar':
+            mismatches = _iter_mismatches_scalar(max_price, max_duration)
+        elif np is not None:
+            mismatches = _iter_mismatches_numpy(max_price, max_duration, chunk_size)
+        else:
+            continue
+        for price, duration, options_mask in mismatches:
+            yield (engine, price, duration, options_mask)
+
+
+def main():
+    """
+    python3 check_cents.py --help
+    """
+    parser = argparse.ArgumentParser(
+        description='Check that the integer (--cents) transactions are the same as the float ones'
+    )
+    parser.add_argument(
+        '--max-price',
+        type=int,
+        default=1_000_000,
+        help='Highest rental price checked, in cents'
+    )
+    parser.add_argument(
+        '--max-duration',
+        type=int,
+        default=90,
+        help='Longest rental duration checked, in days'
+    )
+    parser.add_argument(
+        '--engine',
+        choices=ENGINES,
+        nargs='+',
+        default=ENGINES,
+        help='Engines checked (default both, the scalar one is much slower)'
+    )
+    args = parser.parse_args()
+
+    mismatches = 0
+    for engine, price, duration, options_mask in iter_mismatches(args.max_price, args.max_duration, args.engine):
+        if mismatches < 10:
+            print(f'Mismatch: {engine = }, {price = }, {duration = }, {options_mask = }')
+        mismatches += 1
+    print(f'{mismatches} mismatches')
+    exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import struct
+from contextlib import nullcontext
+from typing import Optional, Tuple
+
+from Getaround.Car import Car
+from Getaround.Getaround import Getaround
+from Getaround.RentalOptions import RENTAL_OPTIONS
+from Getaround.RentalRequest import RentalRequest
+from utils.compression import DEFAULT_LEVEL, open_file
+from utils.json import RentalsWriter
+from utils.sidecar import RentalIndex, get_index_path
+
+_PRICING_INPUTS = struct.Struct('<5qQ2q')
+
+
+def get_config_digest() -> bytes:
+    """Hash the pricing rules: discounts, options and money engine
+    Returns:
+        bytes: 16 bytes digest
+    """
+    config = [
+        Getaround.DISCOUNT_CURVE.discounts,
+        RENTAL_OPTIONS.definitions(),
+        Getaround.CENTS,
+    ]
+    return hashlib.blake2b(json.dumps(config).encode(), digest_size=16).digest()
+
+
+def get_rental_digest(rental: RentalRequest, car: Car) -> bytes:
+    """Hash the effective pricing inputs of a rental: its own fields,
+    its options and the prices of its car
+    Returns:
+        bytes: 16 bytes digest
+    """
+    return hashlib.blake2b(_PRICING_INPUTS.pack(
+        rental.id,
+        rental.start_date.toordinal(),
+        rental.end_date.toordinal(),
+        rental.distance,
+        rental.options_mask,
+        rental.options_order,
+        car.price_per_day,
+        car.price_per_km,
+    ), digest_size=16).digest()
+
+
+def save_delta(
+    rental_service: Getaround,
+    output_path: str,
+    compresslevel: int = DEFAULT_LEVEL,
+) -> Tuple[int, int]:
+    """Write the output of all rentals, re-computing only the rentals whose
+    pricing inputs hash changed since the previous run. The hashes and the
+    position of each rental in the output are stored in output_path + '.idx',
+    with the size of the output they describe.
+    The objects of unchanged rentals are copied from the previous output
+    without being serialized again
+    Args:
+        rental_service (Getaround): service holding the cars and rentals
+        output_path (str): path to the json output, replaced at the end
+        compresslevel (int): compression level of a .gz, .bz2 or .xz output
+    Returns:
+        Tuple[int, int]: number of re-computed and of reused rentals
+    """
+    index_path = get_index_path(output_path)
+    config_digest = get_config_digest()
+    previous: Optional[RentalIndex] = None
+    if os.path.exists(output_path) and os.path.exists(index_path):
+        try:
+            previous = RentalIndex(index_path)
+        except (ValueError, struct.error):
+            # Index of another format
+            previous = None
+        # The index only describes the output it was written with
+        if previous is not None and (
+            previous.config_digest != config_digest
+            or previous.output_size != os.path.getsize(output_path)
+        ):
+            previous.close()
+            previous = None
+
+    computed = reused = 0
+    with RentalsWriter(
+        output_path, index_path, config_digest, atomic=True, compresslevel=compresslevel
+    ) as writer:
+        with open_file(output_path, 'rb') if previous is not None else nullcontext() as previous_fd:
+            try:
+                for rental in rental_service.rentals.values():
+                    car = rental_service.cars[rental.car_id]
+                    digest = get_rental_digest(rental, car)
+                    record = previous.get(rental.id) if previous is not None else None
+                    data = None
+                    if record is not None and record.digest == digest:
+                        previous_fd.seek(record.offset)
+                        data = previous_fd.read(record.length)
+                    if data is not None and len(data) == record.length:
+                        writer.write_raw(rental.id, data, digest)
+                        reused += 1
+                    else:
+                        writer.write(rental_service.compute_one_rental(rental.id), digest)
+                        computed += 1
+            finally:
+                if previous is not None:
+                    previous.close()
+    return (computed, reused)
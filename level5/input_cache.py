@@ -0,0 +1,167 @@
+import hashlib
+import json
+import os
+import struct
+from array import array
+from typing import BinaryIO, List, Optional, Tuple
+
+from parsing import parse_input_table
+from Getaround.CarTable import CarTable
+from Getaround.RentalOptions import RENTAL_OPTIONS
+from Getaround.RentalTable import RentalTable
+
+# magic, size and mtime of the input, hash of its content, hash of the option
+# types (they give the bits of the options masks), json lines input
+HEADER = struct.Struct('<8sQq16s16s?')
+# typecode, number of items of a column
+COLUMN = struct.Struct('<cQ')
+MAGIC = b'GARPIC2\0'
+CHUNK_SIZE = 1 << 20
+
+
+def get_cache_path(input_path: str) -> str:
+    return input_path + '.cache'
+
+
+def get_content_digest(path: str) -> bytes:
+    """
+    Returns:
+        bytes: 16 bytes hash of the content of a file
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _get_options_digest() -> bytes:
+    types = [definition['type'] for definition in RENTAL_OPTIONS.definitions()]
+    return hashlib.blake2b(json.dumps(types).encode(), digest_size=16).digest()
+
+
+def _read_columns(fd: BinaryIO, columns: List[array]) -> List[array]:
+    # Fill the empty columns of a new table, checking their types
+    for column in columns:
+        typecode, length = COLUMN.unpack(fd.read(COLUMN.size))
+        if typecode.decode() != column.typecode:
+            raise ValueError('Unexpected column type')
+        column.frombytes(fd.read(length * column.itemsize))
+        if len(column) != length:
+            raise ValueError('Truncated column')
+    return columns
+
+
+def _write_columns(fd: BinaryIO, columns: List[array]) -> None:
+    for column in columns:
+        fd.write(COLUMN.pack(column.typecode.encode(), len(column)))
+        column.tofile(fd)
+
+
+def _refresh_mtime(input_path: str, mtime: int) -> None:
+    # Next runs can trust the mtime again without hashing the content
+    try:
+        with open(get_cache_path(input_path), 'r+b') as fd:
+            fd.seek(struct.calcsize('<8sQ'))
+            fd.write(struct.pack('<q', mtime))
+    except OSError:
+        pass
+
+
+def _same_file(before: os.stat_result, after: os.stat_result) -> bool:
+    return (before.st_size, before.st_mtime_ns) == (after.st_size, after.st_mtime_ns)
+
+
+def load_cache(input_path: str, ndjson: bool = False) -> Optional[Tuple[CarTable, RentalTable]]:
+    """Load the tables cached for an input file if it did not change since.
+        The cache is valid when the input has the same size and mtime, or
+        else the same content hash (e.g. after a copy or a touch)
+    Args:
+        input_path (str): path of the input file
+        ndjson (bool): the input holds json lines records (see iterNDJSON)
+    Returns:
+        Optional[Tuple[CarTable, RentalTable]]: the cached tables, None if
+        there is no valid cache
+    """
+    try:
+        stat = os.stat(input_path)
+        with open(get_cache_path(input_path), 'rb') as fd:
+            magic, size, mtime, content_digest, options_digest, cached_ndjson = HEADER.unpack(
+                fd.read(HEADER.size)
+            )
+            if (
+                magic != MAGIC or size != stat.st_size or cached_ndjson != ndjson
+                or options_digest != _get_options_digest()
+            ):
+                return None
+            if mtime != stat.st_mtime_ns:
+                if content_digest != get_content_digest(input_path):
+                    return None
+                _refresh_mtime(input_path, stat.st_mtime_ns)
+            car_columns = _read_columns(fd, CarTable().columns())
+            rental_columns = _read_columns(fd, RentalTable().columns())
+    except (OSError, ValueError, struct.error):
+        return None
+    return CarTable.from_columns(car_columns), RentalTable.from_columns(rental_columns)
+
+
+def save_cache(
+    input_path: str,
+    cars: CarTable,
+    rentals: RentalTable,
+    ndjson: bool = False,
+    stat: Optional[os.stat_result] = None,
+    content_digest: Optional[bytes] = None,
+) -> bool:
+    """Cache the tables parsed from an input file next to it (input_path + '.cache')
+    Args:
+        input_path (str): path of the input file
+        cars (CarTable): cars of the input
+        rentals (RentalTable): rentals of the input, resolved against cars
+        ndjson (bool): the input holds json lines records (see iterNDJSON)
+        stat (Optional[os.stat_result]): stat of the input taken before parsing
+            it, taken now when None
+        content_digest (Optional[bytes]): hash of the input taken before
+            parsing it (see get_content_digest), computed now when None
+    Returns:
+        bool: whether the cache could be written
+    """
+    cache_path = get_cache_path(input_path)
+    try:
+        if stat is None:
+            stat = os.stat(input_path)
+        if content_digest is None:
+            content_digest = get_content_digest(input_path)
+        with open(cache_path + '.tmp', 'wb') as fd:
+            fd.write(HEADER.pack(
+                MAGIC, stat.st_size, stat.st_mtime_ns,
+                content_digest, _get_options_digest(), ndjson,
+            ))
+            _write_columns(fd, cars.columns())
+            _write_columns(fd, rentals.columns())
+        os.replace(cache_path + '.tmp', cache_path)
+    except OSError:
+        return False
+    return True
+
+
+def parse_input_cached(input_path: str, ndjson: bool = False) -> Tuple[CarTable, RentalTable]:
+    """Parse an input file into tables (see parse_input_table), from its
+    cache when it is valid. The cache is (re)written otherwise
+    Args:
+        input_path (str): path of the input file
+        ndjson (bool): the input holds json lines records (see iterNDJSON)
+    Returns:
+        Tuple[CarTable, RentalTable]: tables of the cars and of the rentals,
+        rentals are resolved against the cars table
+    """
+    tables = load_cache(input_path, ndjson)
+    if tables is None:
+        # The tables are cached under the input as it was before parsing: an
+        # input changed meanwhile does not match the cache on the next run
+        stat = os.stat(input_path)
+        content_digest = get_content_digest(input_path)
+        tables = parse_input_table(input_path, ndjson)
+        if _same_file(stat, os.stat(input_path)):
+            save_cache(input_path, *tables, ndjson, stat, content_digest)
+    return tables
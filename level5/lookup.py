@@ -0,0 +1,125 @@
+import argparse
+import json
+from typing import Dict, Final, Optional
+
+from utils.compression import open_file
+from utils.sidecar import RentalIndex, get_index_path
+
+
+class OutputLookup:
+    """Read single rentals of an output file (json or json lines) through its
+    sidecar index (output_path + '.idx', written along the output by main.py):
+    only the object of the rental is read and decoded, whatever the size of the output.
+        Seeking in a compressed output decompresses it up to the rental
+    Usage:
+        with OutputLookup(output_path) as lookup:
+            rental = lookup.get(rental_id)
+    """
+
+    def __init__(self, output_path: str, index_path: Optional[str] = None) -> None:
+        self.output_path = output_path
+        self.index = RentalIndex(index_path if index_path is not None else get_index_path(output_path))
+        try:
+            self.fd = open_file(output_path, 'rb')
+        except Exception:
+            self.index.close()
+            raise
+
+    def __enter__(self) -> 'OutputLookup':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.fd.close()
+        self.index.close()
+
+    def get_raw(self, rental_id: int) -> Optional[bytes]:
+        """
+        Args:
+            rental_id (int): id of the rental
+        Returns:
+            Optional[bytes]: json object of the rental as written in the
+            output, None if it is not indexed
+        """
+        record = self.index.get(rental_id)
+        if record is None:
+            return None
+        self.fd.seek(record.offset)
+        return self.fd.read(record.length)
+
+    def get(self, rental_id: int) -> Optional[Dict]:
+        """Read and decode the object of one rental, raise ValueError if the
+        index does not match the output (e.g. the output was written again without it)
+        Args:
+            rental_id (int): id of the rental
+        Returns:
+            Optional[Dict]: output of the rental, None if it is not indexed
+        """
+        data = self.get_raw(rental_id)
+        if data is None:
+            return None
+        try:
+            rental = json.loads(data)
+        except ValueError:
+            rental = None
+        if not isinstance(rental, dict) or rental.get('id') != rental_id:
+            raise ValueError(f'The index of {self.output_path} is out of date')
+        return rental
+
+
+def lookup_rental(output_path: str, rental_id: int) -> Optional[Dict]:
+    """Read the output of one rental from an output file and its sidecar index
+    Args:
+        output_path (str): path to the output json file
+        rental_id (int): id of the rental
+    Returns:
+        Optional[Dict]: output of the rental, None if it is not in the output
+    """
+    with OutputLookup(output_path) as lookup:
+        return lookup.get(rental_id)
+
+
+def main():
+    """
+    python3 lookup.py --help
+    """
+    OUTPUT_PATH: Final = './data/output.json'
+
+    parser = argparse.ArgumentParser(
+        description='Print the output of some rentals, read through the sidecar index of the output'
+    )
+    parser.add_argument(
+        'rental_ids',
+        type=int,
+        nargs='+',
+        metavar='RENTAL_ID',
+        help='Id of a rental to print'
+    )
+    parser.add_argument(
+        '--output',
+        default=OUTPUT_PATH,
+        metavar='PATH',
+        help=f'Output file written by main.py (default {OUTPUT_PATH}, index in PATH.idx)'
+    )
+    args = parser.parse_args()
+
+    missing = False
+    try:
+        with OutputLookup(args.output) as lookup:
+            for rental_id in args.rental_ids:
+                rental = lookup.get(rental_id)
+                if rental is None:
+                    print(f'Rental {rental_id} not found')
+                    missing = True
+                else:
+                    print(json.dumps(rental, indent=2))
+    except Exception as e:
+        print(e)
+        exit(1)
+    exit(1 if missing else 0)
+
+
+if __name__ == "__main__":
+    main()
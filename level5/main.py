@@ -1,9 +1,103 @@
 import argparse
+import sys
+from contextlib import nullcontext
 from typing import Final
 
-from parsing import parse_input
-from utils.json import loadJSON, saveJSON
+from parsing import add_pricing_arguments, load_pricing_config, parse_data, parse_input_stream, parse_input_table
+from utils.json import loadJSON, loadNDJSON, NDJSONWriter, RentalsWriter
+from utils.compression import DEFAULT_LEVEL
+from utils.profiling import StageProfiler
+from utils.sidecar import get_index_path
 from Getaround.Getaround import Getaround
+from Getaround.BatchPricing import BatchPricing
+from parallel import iter_rentals_parallel, iter_table_parallel
+from delta import save_delta
+from input_cache import parse_input_cached
+from rental_store import RentalStore, is_rental_store
+
+
+def run(args: argparse.Namespace, profiler: StageProfiler, input_path: str, output_path: str) -> None:
+    """Load the pricing rules and the input, compute the rentals and write them
+    Args:
+        args (argparse.Namespace): parsed command line
+        profiler (StageProfiler): measures the stages (disabled without --profile)
+        input_path (str): path to the input file
+        output_path (str): path to the output file
+    """
+    load_pricing_config(args)
+
+    # Converted inputs (see rental_store.py) are mapped instead of parsed
+    is_store = input_path != '-' and is_rental_store(input_path)
+    with RentalStore(input_path) if is_store else nullcontext() as store:
+        if store is not None:
+            # Rentals are read from the mapped store as they are priced
+            if args.engine == 'batch':
+                output_rentals = store.iter_outputs()
+            else:
+                cars, rentals = store.cars.to_cars(), store
+        elif args.engine == 'batch':
+            # Columnar tables are always parsed element by element
+            with profiler.stage('load+parse'):
+                if args.input_cache is True:
+                    car_table, rental_table = parse_input_cached(input_path, args.ndjson)
+                else:
+                    car_table, rental_table = parse_input_table(input_path, args.ndjson)
+            if args.workers > 1:
+                output_rentals = iter_table_parallel(car_table, rental_table, args.workers)
+            else:
+                output_rentals = BatchPricing.iter_table(car_table, rental_table)
+        else:
+            if args.input_cache is True:
+                with profiler.stage('load+parse'):
+                    car_table, rental_table = parse_input_cached(input_path, args.ndjson)
+                    cars = car_table.to_cars()
+                    rentals = rental_table.to_requests(car_table)
+                del car_table, rental_table
+            elif args.stream is True or args.ndjson is True:
+                with profiler.stage('load+parse'):
+                    cars, rentals = parse_input_stream(input_path, args.ndjson)
+            else:
+                with profiler.stage('load'):
+                    input_data = loadJSON(input_path)
+                with profiler.stage('parse'):
+                    cars, rentals = parse_data(input_data)
+                del input_data
+
+        if args.engine != 'batch':
+            if args.delta is True:
+                with profiler.stage('compute+save'):
+                    computed, reused = save_delta(
+                        Getaround(cars, rentals, args.cache_size), output_path, args.compress_level
+                    )
+                print(f'Delta run: {computed} rentals computed, {reused} reused', file=profiler.stream or sys.stdout)
+                output_rentals = None
+            elif args.workers > 1:
+                output_rentals = iter_rentals_parallel(
+                    cars, rentals, args.workers, cache_size=args.cache_size
+                )
+            else:
+                output_rentals = Getaround(cars, rentals, args.cache_size).iter_rentals()
+
+        if output_rentals is not None:
+            # Rentals are written as soon as they are computed: both stages are
+            # measured rental by rental
+            computed_rentals = profiler.iter_stage('compute', output_rentals)
+            # The sidecar index gives the position of each rental (see lookup.py)
+            if args.ndjson is True:
+                writer = NDJSONWriter(
+                    output_path, args.compress_level,
+                    get_index_path(output_path) if output_path != '-' else None,
+                )
+            else:
+                # A failing rental keeps the previous output
+                writer = RentalsWriter(
+                    output_path, get_index_path(output_path), atomic=True,
+                    compresslevel=args.compress_level,
+                )
+            with writer:
+                write = profiler.wrap('save', writer.write)
+                for rental in computed_rentals:
+                    write(rental)
 
 
 def main():
@@ -22,18 +116,108 @@ def main():
         action='store_true',
         help=f'Check if the output is equal to the expected one ({EXPECTED_PATH})'
     )
+    parser.add_argument(
+        '--stream',
+        action='store_true',
+        help=f'Parse {INPUT_PATH} element by element to keep memory bounded'
+    )
+    parser.add_argument(
+        '--engine',
+        choices=('scalar', 'batch'),
+        default='scalar',
+        help='Price rentals one by one (scalar) or by vectorized batches (batch)'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Price rentals in a pool of N processes'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=1 << 16,
+        metavar='N',
+        help='Reuse the actions of the N last distinct pricing inputs (scalar engine)'
+    )
+    add_pricing_arguments(parser)
+    parser.add_argument(
+        '--delta',
+        action='store_true',
+        help=f'Only re-compute the rentals whose pricing inputs changed since the previous --delta run (hashes in {OUTPUT_PATH}.idx)'
+    )
+    parser.add_argument(
+        '--profile',
+        action='store_true',
+        help='Print the wall time and cpu time of each stage, and the peak memory of the process when it ended'
+    )
+    parser.add_argument(
+        '--profile-stats',
+        metavar='PATH',
+        help='Dump the cProfile stats of the run to PATH (read them with python3 -m pstats PATH)'
+    )
+    parser.add_argument(
+        '--latency',
+        action='store_true',
+        help='With --profile, also print a histogram of the computation time of each rental'
+    )
+    parser.add_argument(
+        '--input',
+        default=INPUT_PATH,
+        metavar='PATH',
+        help='Read the input from PATH instead (- for the standard input with --ndjson, or a store made by rental_store.py convert)'
+    )
+    parser.add_argument(
+        '--output',
+        default=OUTPUT_PATH,
+        metavar='PATH',
+        help='Write the output to PATH and its sidecar index to PATH.idx instead (- for the standard output with --ndjson)'
+    )
+    parser.add_argument(
+        '--ndjson',
+        action='store_true',
+        help='Read json lines records tagged by "kind" (car, rental or option) and write one rental per line'
+    )
+    parser.add_argument(
+        '--compress-level',
+        type=int,
+        default=DEFAULT_LEVEL,
+        choices=range(1, 10),
+        metavar='N',
+        help=f'Compression level (1-9) of an output ending with .gz, .bz2 or .xz (default {DEFAULT_LEVEL})'
+    )
+    parser.add_argument(
+        '--input-cache',
+        action='store_true',
+        help='Reuse the tables parsed by a previous run from PATH.cache next to the input, while the input does not change'
+    )
     args = parser.parse_args()
+    if args.delta and (args.engine != 'scalar' or args.workers > 1):
+        parser.error('--delta only works with the scalar engine and a single worker')
+    if args.delta and args.ndjson:
+        parser.error('--delta only works with the json output')
+    if not args.ndjson and '-' in (args.input, args.output):
+        parser.error('The standard input and output can only be used with --ndjson')
+    if args.input_cache and args.input == '-':
+        parser.error('--input-cache needs an input file')
+    if args.test and args.output == '-':
+        parser.error('--test needs an output file')
+    if args.engine == 'batch' and args.workers > 1 and args.input != '-' and is_rental_store(args.input):
+        parser.error('The batch engine prices a rental store with a single worker')
 
-    cars, rentals = parse_input(INPUT_PATH)
-    rental_service = Getaround(cars, rentals)
-
-    rental_service.compute_rentals()
-    output = {'rentals': rental_service.output}
-    saveJSON(output, OUTPUT_PATH)
+    # The standard output only holds the rentals when they are written there
+    log = sys.stderr if args.output == '-' else None
+    with StageProfiler(args.profile, args.latency, args.profile_stats, log) as profiler:
+        run(args, profiler, args.input, args.output)
 
     if args.test is True:
         expected_data = loadJSON(EXPECTED_PATH)
-        print(f"Correct output: {expected_data == output}")
+        if args.ndjson is True:
+            output_data = {'rentals': loadNDJSON(args.output)}
+        else:
+            output_data = loadJSON(args.output)
+        print(f"Correct output: {expected_data == output_data}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,214 @@
+from array import array
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from multiprocessing.shared_memory import SharedMemory
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+from Getaround.BatchPricing import BatchPricing, np
+from Getaround.Car import Car
+from Getaround.CarTable import CarTable
+from Getaround.Getaround import Getaround
+from Getaround.RentalOptions import RENTAL_OPTIONS, RentalOptionDefinition
+from Getaround.RentalRequest import RentalRequest
+from Getaround.RentalTable import RentalTable
+
+# (shared memory name, array typecode, number of items) of a shared column
+SharedColumn = Tuple[str, str, int]
+
+# Discounts, options and money engine of the parent process, for the workers
+PricingConfig = Tuple[Tuple[Tuple[float, int], ...], List[RentalOptionDefinition], bool]
+
+# Pricing service of a worker process, holding the cars sent once at startup
+_rental_service: Optional[Getaround] = None
+
+
+def _get_pricing_config() -> PricingConfig:
+    return (
+        Getaround.DISCOUNT_CURVE.discounts,
+        RENTAL_OPTIONS.definitions(),
+        Getaround.CENTS,
+    )
+
+
+def _set_pricing_config(config: PricingConfig) -> None:
+    discounts, options, cents = config
+    Getaround.set_discounts(discounts)
+    RENTAL_OPTIONS.load(options)
+    Getaround.CENTS = cents
+
+
+def _init_worker(cars: Dict[int, Car], config: PricingConfig, cache_size: int) -> None:
+    global _rental_service
+    _set_pricing_config(config)
+    _rental_service = Getaround(cars, {}, cache_size)
+
+
+def _compute_shard(rentals: List[RentalRequest]) -> List[Dict]:
+    _rental_service.rentals = {rental.id: rental for rental in rentals}
+    return list(_rental_service.iter_rentals())
+
+
+def iter_rentals_parallel(
+    cars: Dict[int, Car],
+    rentals: Dict[int, RentalRequest],
+    workers: int,
+    shard_size: int = 1 << 12,
+    cache_size: int = 1 << 16,
+) -> Iterator[Dict]:
+    """Compute all rentals in a pool of processes.
+        Rentals are cut in shards of consecutive rentals (id ranges when the
+        input is sorted by id), and the cars are sent once to each worker.
+        At most 2 shards per worker are in flight, to keep memory bounded
+    Args:
+        cars (Dict[int, Car]): cars by id
+        rentals (Dict[int, RentalRequest]): rentals by id
+        workers (int): number of worker processes
+        shard_size (int): number of rentals per shard
+        cache_size (int): size of the pricing cache of each worker
+    Yields:
+        Dict: Output of one rental (same as Getaround.compute_one_rental),
+        in the rentals order
+    """
+    rentals_iter = iter(rentals.values())
+    shards = iter(lambda: list(islice(rentals_iter, shard_size)), [])
+    pending: Deque[Future] = deque()
+
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(cars, _get_pricing_config(), cache_size),
+    ) as pool:
+        for shard in shards:
+            pending.append(pool.submit(_compute_shard, shard))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+# Views on the shared columns of a worker process, by column name
+_columns: Dict[str, memoryview] = {}
+_segments: List[SharedMemory] = []
+
+
+def _create_column(
+    typecode: str,
+    length: int,
+    segments: List[SharedMemory],
+) -> Tuple[SharedColumn, SharedMemory]:
+    size = length * array(typecode).itemsize
+    segment = SharedMemory(create=True, size=max(size, 1))
+    segments.append(segment)
+    return (segment.name, typecode, length), segment
+
+
+def _share_column(column: array, segments: List[SharedMemory]) -> SharedColumn:
+    shared, segment = _create_column(column.typecode, len(column), segments)
+    segment.buf[:len(column) * column.itemsize] = memoryview(column).cast('B')
+    return shared
+
+
+def _attach_column(shared: SharedColumn) -> memoryview:
+    name, typecode, length = shared
+    # Workers share the resource tracker of the parent, which unlinks the segment
+    segment = SharedMemory(name=name)
+    _segments.append(segment)
+    return segment.buf[:length * array(typecode).itemsize].cast(typecode)
+
+
+def _init_table_worker(shared: Dict[str, SharedColumn], config: PricingConfig) -> None:
+    _set_pricing_config(config)
+    for name, shared_column in shared.items():
+        _columns[name] = _attach_column(shared_column)
+
+
+def _compute_table_shard(start: int, end: int) -> None:
+    amounts = BatchPricing.compute_columns(
+        _columns['price_per_day'],
+        _columns['price_per_km'],
+        _columns['car_index'][start:end],
+        _columns['duration'][start:end],
+        _columns['distance'][start:end],
+        _columns['options_mask'][start:end],
+    )
+    length = len(_columns['duration'])
+    for row, actor in enumerate(BatchPricing.ACTORS):
+        target = _columns['output'][row * length + start:row * length + end]
+        if np is None:
+            target[:] = array('q', amounts[actor])
+        else:
+            np.frombuffer(target, dtype=np.int64)[:] = amounts[actor]
+
+
+def iter_table_parallel(
+    cars: CarTable,
+    rentals: RentalTable,
+    workers: int,
+    shard_size: int = 1 << 16,
+) -> Iterator[Dict]:
+    """Compute all rentals of columnar tables in a pool of processes.
+        The columns are copied once into shared memory segments: workers
+        read them without copy, only receive the (start, end) rows of their
+        shard, and write the amounts into a shared output column
+    Args:
+        cars (CarTable): cars the rentals have been resolved against
+        rentals (RentalTable): rentals to compute
+        workers (int): number of worker processes
+        shard_size (int): number of rentals per shard
+    Yields:
+        Dict: Output of one rental, in the table order
+    """
+    length = len(rentals)
+    segments: List[SharedMemory] = []
+    output: Optional[memoryview] = None
+    try:
+        shared_output, output_segment = _create_column(
+            'q', length * len(BatchPricing.ACTORS), segments
+        )
+        output = output_segment.buf[:8 * length * len(BatchPricing.ACTORS)].cast('q')
+        shared = {
+            'price_per_day': _share_column(cars.price_per_day, segments),
+            'price_per_km': _share_column(cars.price_per_km, segments),
+            'car_index': _share_column(rentals.car_index, segments),
+            'duration': _share_column(rentals.duration(), segments),
+            'distance': _share_column(rentals.distance, segments),
+            'options_mask': _share_column(rentals.options_mask, segments),
+            'output': shared_output,
+        }
+        pending: Deque[Tuple[int, int, Future]] = deque()
+
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_table_worker,
+            initargs=(shared, _get_pricing_config()),
+        ) as pool:
+            for start in range(0, length, shard_size):
+                end = min(start + shard_size, length)
+                pending.append((start, end, pool.submit(_compute_table_shard, start, end)))
+                if len(pending) >= 2 * workers:
+                    yield from _iter_shard_outputs(rentals, output, *pending.popleft())
+            while pending:
+                yield from _iter_shard_outputs(rentals, output, *pending.popleft())
+    finally:
+        if output is not None:
+            output.release()
+        for segment in segments:
+            segment.close()
+            segment.unlink()
+
+
+def _iter_shard_outputs(
+    rentals: RentalTable,
+    output: memoryview,
+    start: int,
+    end: int,
+    future: Future,
+) -> Iterator[Dict]:
+    future.result()
+    length = len(rentals)
+    amounts = {
+        actor: output[row * length + start:row * length + end]
+        for row, actor in enumerate(BatchPricing.ACTORS)
+    }
+    yield from BatchPricing.iter_outputs(rentals, amounts, start, end)
@@ -1,9 +1,14 @@
-from utils.json import loadJSON
-from typing import Dict, Tuple, List, cast, TypedDict
+import argparse
+
+from utils.json import loadJSON, iterJSON, iterNDJSON
+from typing import Any, Dict, Iterator, Tuple, List, cast, TypedDict
 
 from Getaround.Car import Car, CarInit
+from Getaround.CarTable import CarTable
+from Getaround.Getaround import Getaround
 from Getaround.RentalRequest import RentalRequest, RentalRequestInit
-from Getaround.RentalOptions import RentalOptionsInit
+from Getaround.RentalTable import RentalTable
+from Getaround.RentalOptions import RENTAL_OPTIONS, RentalOptionsInit
 
 
 class InputType(TypedDict):
@@ -20,8 +25,16 @@ def parse_input(json_path: str) -> Tuple[Dict[int, Car], Dict[int, RentalRequest
         Tuple[Dict[int, Car], Dict[int, RentalRequest]]: tuple containing
         dictionnaries of Cars and Rentals where their key is their id
     """
-    input_data = cast(InputType, loadJSON(json_path))
+    return parse_data(cast(InputType, loadJSON(json_path)))
+
 
+def parse_data(input_data: InputType) -> Tuple[Dict[int, Car], Dict[int, RentalRequest]]:
+    """Build cars and rentals from already loaded json data
+    Args:
+        input_data (InputType): content of an input file
+    Returns:
+        Tuple[Dict[int, Car], Dict[int, RentalRequest]]: same as parse_input
+    """
     cars = {
         car['id']: Car(car) for car in input_data['cars']
     }
@@ -31,5 +44,130 @@ def parse_input(json_path: str) -> Tuple[Dict[int, Car], Dict[int, RentalRequest
     if 'options' in input_data.keys():
         for opt in input_data['options']:
             rental = rentals[opt['rental_id']]
-            rental.options.append(opt['type'])
+            rental.add_option(opt['type'])
+    return (cars, rentals)
+
+
+def iter_records(json_path: str, ndjson: bool = False) -> Iterator[Tuple[str, Any]]:
+    """Walk the cars, rentals and options of an input file element by element
+    Args:
+        json_path (str): path to json file
+        ndjson (bool): the file holds json lines records (see iterNDJSON)
+    Yields:
+        Tuple[str, Any]: member of the input (cars, rentals or options) and one of its elements
+    """
+    return iterNDJSON(json_path) if ndjson else iterJSON(json_path)
+
+
+def parse_input_stream(json_path: str, ndjson: bool = False) -> Tuple[Dict[int, Car], Dict[int, RentalRequest]]:
+    """Parse cars and rentals from a file element by element, so the raw json
+    document is never held in memory. Options can come before their rental:
+    they are kept aside until the rental is parsed
+    Args:
+        json_path (str): path to json file
+        ndjson (bool): the file holds json lines records (see iterNDJSON)
+    Returns:
+        Tuple[Dict[int, Car], Dict[int, RentalRequest]]: tuple containing
+        dictionnaries of Cars and Rentals where their key is their id
+    """
+    cars: Dict[int, Car] = {}
+    rentals: Dict[int, RentalRequest] = {}
+    pending_options: Dict[int, List[str]] = {}
+
+    for key, item in iter_records(json_path, ndjson):
+        if key == 'cars':
+            cars[item['id']] = Car(item)
+        elif key == 'rentals':
+            rental = RentalRequest(item)
+            for option in pending_options.pop(rental.id, []):
+                rental.add_option(option)
+            rentals[rental.id] = rental
+        elif key == 'options':
+            if item['rental_id'] in rentals:
+                rentals[item['rental_id']].add_option(item['type'])
+            else:
+                pending_options.setdefault(
+                    item['rental_id'], []).append(item['type'])
+    if pending_options:
+        raise KeyError(
+            f'Options refer to unknown rentals: {list(pending_options)}'
+        )
     return (cars, rentals)
+
+
+def parse_cars(json_path: str, ndjson: bool = False) -> Dict[int, Car]:
+    """Parse only the cars of a file, element by element: rentals and
+    options are skipped without building their objects
+    Args:
+        json_path (str): path to json file
+        ndjson (bool): the file holds json lines records (see iterNDJSON)
+    Returns:
+        Dict[int, Car]: Cars by id
+    """
+    return {
+        item['id']: Car(item) for key, item in iter_records(json_path, ndjson) if key == 'cars'
+    }
+
+
+def parse_input_table(json_path: str, ndjson: bool = False) -> Tuple[CarTable, RentalTable]:
+    """Parse cars and rentals from a file element by element, straight into
+    columnar tables. Options can come before their rental
+    Args:
+        json_path (str): path to json file
+        ndjson (bool): the file holds json lines records (see iterNDJSON)
+    Returns:
+        Tuple[CarTable, RentalTable]: tables of the cars and of the rentals,
+        rentals are resolved against the cars table
+    """
+    cars = CarTable()
+    rentals = RentalTable()
+    pending_options: List[RentalOptionsInit] = []
+
+    for key, item in iter_records(json_path, ndjson):
+        if key == 'cars':
+            cars.append(item)
+        elif key == 'rentals':
+            rentals.append(item)
+        elif key == 'options':
+            try:
+                rentals.add_option(rentals.index_of(item['rental_id']), item['type'])
+            except KeyError:
+                pending_options.append(item)
+    for opt in pending_options:
+        rentals.add_option(rentals.index_of(opt['rental_id']), opt['type'])
+    rentals.resolve_cars(cars)
+    return (cars, rentals)
+
+
+def add_pricing_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add the command line arguments of the pricing rules (see load_pricing_config)
+    Args:
+        parser (argparse.ArgumentParser): parser of a command pricing rentals
+    """
+    parser.add_argument(
+        '--discounts',
+        metavar='PATH',
+        help='Json file with the discount schedule as [[ratio, min_days], ...]'
+    )
+    parser.add_argument(
+        '--options',
+        metavar='PATH',
+        help='Json file with the rental options as [{"type", "price_per_day", "beneficiary"}, ...]'
+    )
+    parser.add_argument(
+        '--cents',
+        action='store_true',
+        help='Compute the transactions with integer arithmetic instead of floats'
+    )
+
+
+def load_pricing_config(args: argparse.Namespace) -> None:
+    """Set the pricing rules of the process from the arguments of add_pricing_arguments
+    Args:
+        args (argparse.Namespace): parsed command line
+    """
+    Getaround.CENTS = args.cents
+    if args.discounts is not None:
+        Getaround.set_discounts(loadJSON(args.discounts))
+    if args.options is not None:
+        RENTAL_OPTIONS.load(loadJSON(args.options))
@@ -0,0 +1,159 @@
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from itertools import cycle
+from typing import Dict, Final, Iterator, List, Tuple
+
+from utils.json import loadJSON
+
+
+def get_quote_requests(input_path: str) -> List[bytes]:
+    """Turn the rentals of an input file into quote request bodies
+    Args:
+        input_path (str): input json file (see benchmark/generate.py for big ones)
+    Returns:
+        List[bytes]: json bodies for POST /quote
+    """
+    data = loadJSON(input_path)
+    options: Dict[int, List[str]] = {}
+    for opt in data.get('options', []):
+        options.setdefault(opt['rental_id'], []).append(opt['type'])
+    return [
+        json.dumps({
+            'car_id': rental['car_id'],
+            'start_date': rental['start_date'],
+            'end_date': rental['end_date'],
+            'distance': rental['distance'],
+            'options': options.get(rental['id'], []),
+        }).encode()
+        for rental in data['rentals']
+    ]
+
+
+async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, bytes]:
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, await reader.readexactly(length)
+
+
+async def _run_connection(
+    host: str,
+    port: int,
+    bodies: Iterator[bytes],
+    deadline: float,
+    latencies: List[float],
+    errors: List[int],
+) -> None:
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while time.perf_counter() < deadline:
+            body = next(bodies)
+            start = time.perf_counter()
+            writer.write(
+                f'POST /quote HTTP/1.1\r\nHost: {host}\r\n'
+                f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n'
+                .encode('latin-1') + body
+            )
+            status, _ = await _read_response(reader)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def load_test(
+    host: str,
+    port: int,
+    bodies: List[bytes],
+    connections: int,
+    duration: float,
+) -> Tuple[List[float], List[int], float]:
+    """Send quote requests back to back on concurrent keep-alive connections
+    Args:
+        host (str): address of the quote server
+        port (int): port of the quote server
+        bodies (List[bytes]): request bodies, sent in a loop
+        connections (int): number of concurrent connections
+        duration (float): how long to send requests, in seconds
+    Returns:
+        Tuple[List[float], List[int], float]: latency of each request in
+        seconds, status of the failed requests, and elapsed time in seconds
+    """
+    latencies: List[float] = []
+    errors: List[int] = []
+    bodies_iter = cycle(bodies)
+    start = time.perf_counter()
+    await asyncio.gather(*(
+        _run_connection(host, port, bodies_iter, start + duration, latencies, errors)
+        for _ in range(connections)
+    ))
+    return latencies, errors, time.perf_counter() - start
+
+
+def main():
+    """
+    python3 quote_client.py --help
+    """
+    INPUT_PATH: Final = './data/input.json'
+
+    parser = argparse.ArgumentParser(
+        description='Load test a running quote_server.py and report latency percentiles and throughput'
+    )
+    parser.add_argument(
+        '--input',
+        default=INPUT_PATH,
+        metavar='PATH',
+        help='Json file whose rentals are sent as quote requests'
+    )
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Address of the quote server'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8080,
+        help='Port of the quote server'
+    )
+    parser.add_argument(
+        '--connections',
+        type=int,
+        default=64,
+        metavar='N',
+        help='Number of concurrent keep-alive connections'
+    )
+    parser.add_argument(
+        '--duration',
+        type=float,
+        default=10.0,
+        metavar='SECONDS',
+        help='How long to send requests'
+    )
+    args = parser.parse_args()
+
+    latencies, errors, elapsed = asyncio.run(load_test(
+        args.host, args.port, get_quote_requests(args.input), args.connections, args.duration
+    ))
+    if len(latencies) < 2:
+        print(f'Only {len(latencies)} requests completed')
+        exit(1)
+    percentiles = statistics.quantiles(latencies, n=100)
+    print(f'{len(latencies)} requests in {elapsed:.2f}s: {len(latencies) / elapsed:.0f} requests/s')
+    print(f'p50 {percentiles[49] * 1000:.3f} ms, p99 {percentiles[98] * 1000:.3f} ms')
+    if errors:
+        print(f'{len(errors)} errors (statuses: {sorted(set(errors))})')
+
+
+if __name__ == "__main__":
+    main()
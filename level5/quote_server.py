@@ -0,0 +1,254 @@
+import argparse
+import asyncio
+import json
+import signal
+from http import HTTPStatus
+from typing import Dict, Final, List, Optional, Tuple
+
+from parsing import add_pricing_arguments, load_pricing_config, parse_cars
+from Getaround.BatchPricing import BatchPricing
+from Getaround.Car import Car
+from Getaround.RentalOptions import RENTAL_OPTIONS
+from Getaround.RentalRequest import RentalRequest
+
+MAX_BODY_SIZE: Final = 1 << 16
+MAX_HEADERS: Final = 100
+
+# price_per_day, price_per_km, duration, distance, options_mask of a quote
+QuoteInputs = Tuple[int, int, int, int, int]
+# Pricing inputs, options order (see RENTAL_OPTIONS.select) and future of a pending quote
+PendingQuote = Tuple[QuoteInputs, int, asyncio.Future]
+
+
+class QuoteBatcher:
+    """Coalesce the quotes requested concurrently into batches priced at once
+    by BatchPricing. A batch is priced as soon as it is full, or once the
+    requests already received by the event loop have been read (after
+    max_delay seconds when it is not 0)
+    """
+
+    def __init__(self, cars: Dict[int, Car], max_batch: int = 256, max_delay: float = 0.0) -> None:
+        self.cars = cars
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.pending: List[PendingQuote] = []
+        self._flush_handle: Optional[asyncio.Handle] = None
+        self.batches = 0
+        self.quotes = 0
+
+    def get_inputs(self, request: Dict) -> Tuple[QuoteInputs, int]:
+        """Validate a quote request
+        Args:
+            request (Dict): car_id, start_date, end_date, distance and optional options
+        Returns:
+            Tuple[QuoteInputs, int]: the pricing inputs of the quote and the
+            order of its options, raises on invalid request
+        """
+        car_id = request['car_id']
+        # json true and false are decoded as bool, a subclass of int equal to 1 and 0
+        if isinstance(car_id, bool):
+            raise KeyError(car_id)
+        car = self.cars[car_id]
+        duration = (
+            RentalRequest.parse_day(request['end_date'])
+            - RentalRequest.parse_day(request['start_date']) + 1
+        )
+        if duration < 1:
+            raise ValueError('start_date has to be earlier than end_date')
+        distance = request['distance']
+        if not isinstance(distance, int) or isinstance(distance, bool) or distance < 0:
+            raise ValueError('distance has to be a positive integer')
+        options_mask, options_order = RENTAL_OPTIONS.encode(request.get('options', ()))
+        return (car.price_per_day, car.price_per_km, duration, distance, options_mask), options_order
+
+    async def quote(self, request: Dict) -> Dict:
+        """Price a rental request with the next batch
+        Args:
+            request (Dict): car_id, start_date, end_date, distance and optional options
+        Returns:
+            Dict: driver price, options and actions of the rental
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((*self.get_inputs(request), future))
+        if len(self.pending) >= self.max_batch:
+            self.flush()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            if self.max_delay > 0:
+                self._flush_handle = loop.call_later(self.max_delay, self.flush)
+            else:
+                self._flush_handle = loop.call_soon(self.flush)
+        return await future
+
+    def flush(self) -> None:
+        """Price the pending quotes and resolve their futures"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self.pending = self.pending, []
+        if not batch:
+            return
+        self.batches += 1
+        self.quotes += len(batch)
+        try:
+            amounts = BatchPricing.compute(*zip(*(inputs for inputs, _, _ in batch)))
+        except Exception:
+            # A negative drivy fee fails the whole batch: price one by one
+            for pending in batch:
+                self._resolve_alone(*pending)
+            return
+        for index, (inputs, options_order, future) in enumerate(batch):
+            if not future.cancelled():
+                future.set_result(self._to_quote(amounts, index, inputs[4], options_order))
+
+    def _resolve_alone(self, inputs: QuoteInputs, options_order: int, future: asyncio.Future) -> None:
+        if future.cancelled():
+            return
+        try:
+            amounts = BatchPricing.compute(*([value] for value in inputs))
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(self._to_quote(amounts, 0, inputs[4], options_order))
+
+    @staticmethod
+    def _to_quote(amounts: Dict, index: int, options_mask: int, options_order: int) -> Dict:
+        return {
+            'price': -int(amounts['driver'][index]),
+            'options': RENTAL_OPTIONS.to_options(options_mask, options_order),
+            'actions': BatchPricing.to_actions(amounts, index),
+        }
+
+
+class QuoteServer:
+    """Minimal HTTP/1.1 server (keep-alive, Content-Length bodies) answering
+        POST /quote with a json rental request:
+            {"car_id", "start_date", "end_date", "distance", "options": [...]}
+        by {"price", "options", "actions"}, or {"error"} with a 4xx status
+    """
+
+    def __init__(self, batcher: QuoteBatcher) -> None:
+        self.batcher = batcher
+
+    async def respond(self, method: str, path: str, body: bytes) -> Tuple[HTTPStatus, Dict]:
+        if path != '/quote':
+            return HTTPStatus.NOT_FOUND, {'error': f'Unknown path {path}'}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Use POST'}
+        try:
+            request = json.loads(body)
+            if not isinstance(request, dict):
+                raise ValueError('Expected a json object')
+            return HTTPStatus.OK, await self.batcher.quote(request)
+        except KeyError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': f'Unknown or missing {e}'}
+        except Exception as e:
+            return HTTPStatus.BAD_REQUEST, {'error': str(e)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, version = request_line.decode('latin-1').split()
+                headers: Dict[str, str] = {}
+                for _ in range(MAX_HEADERS):
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get('content-length', 0))
+                if length > MAX_BODY_SIZE:
+                    status, response = HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'Body too large'}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(length)
+                    status, response = await self.respond(method, path, body)
+                    connection = headers.get('connection', '').lower()
+                    keep_alive = connection != 'close' and (
+                        version == 'HTTP/1.1' or connection == 'keep-alive'
+                    )
+                payload = json.dumps(response).encode()
+                writer.write(
+                    f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(payload)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+                    .encode('latin-1') + payload
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError):
+            # Malformed request or client gone: drop the connection
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            address = server.sockets[0].getsockname()
+            print(f'Serving quotes on http://{address[0]}:{address[1]}/quote')
+            await server.serve_forever()
+
+
+def main():
+    """
+    python3 quote_server.py --help
+    """
+    INPUT_PATH: Final = './data/input.json'
+
+    parser = argparse.ArgumentParser(
+        description=f'Serve price quotes over HTTP for the cars of {INPUT_PATH}'
+    )
+    parser.add_argument(
+        '--input',
+        default=INPUT_PATH,
+        metavar='PATH',
+        help='Json file the cars are loaded from (its rentals are ignored)'
+    )
+    parser.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help='Address to listen on'
+    )
+    parser.add_argument(
+        '--port',
+        type=int,
+        default=8080,
+        help='Port to listen on'
+    )
+    parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=256,
+        metavar='N',
+        help='Price at most N concurrent quotes at once'
+    )
+    parser.add_argument(
+        '--batch-delay',
+        type=float,
+        default=0.0,
+        metavar='MS',
+        help='Wait up to MS milliseconds for more quotes before pricing a batch'
+    )
+    add_pricing_arguments(parser)
+    args = parser.parse_args()
+
+    load_pricing_config(args)
+
+    batcher = QuoteBatcher(parse_cars(args.input), args.batch_size, args.batch_delay / 1000)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        asyncio.run(QuoteServer(batcher).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    if batcher.batches:
+        print(f'{batcher.quotes} quotes in {batcher.batches} batches')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,384 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+from typing import BinaryIO, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from parsing import iter_records
+from utils.json import NDJSON_KINDS, loadJSON
+from Getaround.BatchPricing import BatchPricing, np
+from Getaround.CarTable import CarTable
+from Getaround.Getaround import Getaround
+from Getaround.RentalOptions import RENTAL_OPTIONS
+from Getaround.RentalRequest import RentalRequest
+
+# magic, number of cars, of rentals, byte length of the option types (json),
+# kind of id index (see INDEX_*), first rental id of a direct index, number of index entries
+HEADER = struct.Struct('<8sQQQBxxxxxxxqQ')
+# id, price_per_day, price_per_km
+CAR = struct.Struct('<qqq')
+# id, car row, start day, end day (ordinals), distance, options mask and order
+RENTAL = struct.Struct('<qqiiqH6xQ')
+MAGIC = b'GARSTO2\0'
+
+# Rows by rental id - first id, -1 for holes: O(1) lookups when ids are dense
+INDEX_DIRECT = 1
+# (rental id, row) pairs sorted by id: binary search otherwise
+INDEX_SORTED = 2
+INDEX_PAIR = struct.Struct('<qq')
+
+# A direct index may hold up to this number of slots per rental
+MAX_HOLES_RATIO = 4
+
+if np is not None:
+    RENTAL_DTYPE = np.dtype({
+        'names': ['id', 'car_index', 'start_day', 'end_day', 'distance', 'options_mask', 'options_order'],
+        'formats': ['<i8', '<i8', '<i4', '<i4', '<i8', '<u2', '<u8'],
+        'offsets': [0, 8, 16, 20, 24, 32, 40],
+        'itemsize': RENTAL.size,
+    })
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def is_rental_store(path: str) -> bool:
+    """
+    Args:
+        path (str): path of a file
+    Returns:
+        bool: whether the file is a rental store (see convert)
+    """
+    try:
+        with open(path, 'rb') as fd:
+            return fd.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def convert(input_path: str, store_path: str, ndjson: bool = False) -> int:
+    """Convert an input file into a rental store: fixed-width records of the
+    cars and of the rentals (with their options mask and order), and an index
+    of the rows by rental id. The input is read twice element by element, only
+    the ids and options of the rentals are held in memory (18 bytes per rental)
+    Args:
+        input_path (str): path of the input file
+        store_path (str): path of the rental store, replaced at the end
+        ndjson (bool): the input holds json lines records (see iterNDJSON)
+    Returns:
+        int: number of rentals converted
+    """
+    cars = CarTable()
+    for key, item in iter_records(input_path, ndjson):
+        if key == 'cars':
+            cars.append(item)
+
+    option_types = json.dumps(
+        [definition['type'] for definition in RENTAL_OPTIONS.definitions()]
+    ).encode()
+    rentals_offset = _align(HEADER.size + len(option_types)) + len(cars) * CAR.size
+    ids = array('q')
+    masks = array('H')
+    orders = array('Q')
+    rows: Optional[Dict[int, int]] = None
+    # Options of the rentals not read yet
+    pending_options: Dict[int, Tuple[int, int]] = {}
+
+    with open(store_path + '.tmp', 'w+b') as fd:
+        fd.write(b'\0' * HEADER.size + option_types)
+        fd.write(b'\0' * (_align(fd.tell()) - fd.tell()))
+        for index in range(len(cars)):
+            fd.write(CAR.pack(cars.ids[index], cars.price_per_day[index], cars.price_per_km[index]))
+
+        for key, item in iter_records(input_path, ndjson):
+            if key == 'rentals':
+                start_day = RentalRequest.parse_day(item['start_date'])
+                end_day = RentalRequest.parse_day(item['end_date'])
+                if (start_day > end_day):
+                    raise ValueError('start_date has to be earlier than end_date')
+                if rows is not None:
+                    rows[item['id']] = len(ids)
+                elif ids and ids[-1] >= item['id']:
+                    # Ids are not increasing anymore, bisect cannot be used
+                    rows = {rental_id: row for row, rental_id in enumerate(ids)}
+                    rows[item['id']] = len(ids)
+                ids.append(item['id'])
+                mask, order = pending_options.pop(item['id'], (0, 0))
+                masks.append(mask)
+                orders.append(order)
+                fd.write(RENTAL.pack(
+                    item['id'], cars.index[item['car_id']],
+                    start_day, end_day, item['distance'], 0, 0,
+                ))
+            elif key == 'options':
+                row = _find_row(ids, rows, item['rental_id'])
+                if row < 0:
+                    pending_options[item['rental_id']] = RENTAL_OPTIONS.select(
+                        *pending_options.get(item['rental_id'], (0, 0)), item['type']
+                    )
+                else:
+                    masks[row], orders[row] = RENTAL_OPTIONS.select(masks[row], orders[row], item['type'])
+        if pending_options:
+            raise KeyError(f'Options refer to unknown rentals: {list(pending_options)}')
+
+        index_kind, index_base, index_count = _write_index(fd, ids)
+        fd.seek(0)
+        fd.write(HEADER.pack(
+            MAGIC, len(cars), len(ids), len(option_types), index_kind, index_base, index_count,
+        ))
+        fd.flush()
+        # Options are patched in place once all options are known
+        with mmap.mmap(fd.fileno(), 0) as mapped:
+            for row, mask in enumerate(masks):
+                if mask:
+                    offset = rentals_offset + row * RENTAL.size
+                    struct.pack_into('<H', mapped, offset + 32, mask)
+                    struct.pack_into('<Q', mapped, offset + 40, orders[row])
+    os.replace(store_path + '.tmp', store_path)
+    return len(ids)
+
+
+def _find_row(ids: array, rows: Optional[Dict[int, int]], rental_id: int) -> int:
+    if rows is not None:
+        return rows.get(rental_id, -1)
+    row = bisect_left(ids, rental_id)
+    return row if row < len(ids) and ids[row] == rental_id else -1
+
+
+def _write_index(fd: BinaryIO, ids: array) -> Tuple[int, int, int]:
+    if not ids:
+        return INDEX_DIRECT, 0, 0
+    first_id, last_id = min(ids), max(ids)
+    span = last_id - first_id + 1
+    if span <= MAX_HOLES_RATIO * len(ids):
+        direct = array('q', [-1]) * span
+        for row, rental_id in enumerate(ids):
+            direct[rental_id - first_id] = row
+        direct.tofile(fd)
+        return INDEX_DIRECT, first_id, span
+    for row in sorted(range(len(ids)), key=ids.__getitem__):
+        fd.write(INDEX_PAIR.pack(ids[row], row))
+    return INDEX_SORTED, 0, len(ids)
+
+
+class RentalStore(Mapping):
+    """Read-only, memory-mapped rental store (see convert): rentals are only
+    read when accessed, so stores bigger than memory can be priced.
+        As a mapping of rental id to RentalRequest, it can be the rentals of a
+        Getaround service. Lookups by id are O(1) when ids are dense, a binary
+        search otherwise
+    Usage:
+        with RentalStore(path) as store:
+            rental_service = Getaround(store.cars.to_cars(), store)
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as fd:
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (
+                magic, car_count, self.count, options_length,
+                self._index_kind, self._index_base, self._index_count,
+            ) = HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f'{path} is not a rental store')
+            option_types = json.loads(self._map[HEADER.size:HEADER.size + options_length])
+            registered = [definition['type'] for definition in RENTAL_OPTIONS.definitions()]
+            if option_types != registered:
+                raise ValueError(
+                    f'{path} was converted with the options {option_types}, not {registered}'
+                )
+        except Exception:
+            self._map.close()
+            raise
+        cars_offset = _align(HEADER.size + options_length)
+        self._rentals_offset = cars_offset + car_count * CAR.size
+        self._index_offset = self._rentals_offset + self.count * RENTAL.size
+
+        self.cars = CarTable()
+        for car_id, price_per_day, price_per_km in CAR.iter_unpack(
+            self._map[cars_offset:self._rentals_offset]
+        ):
+            self.cars.append({'id': car_id, 'price_per_day': price_per_day, 'price_per_km': price_per_km})
+
+    def __enter__(self) -> 'RentalStore':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        try:
+            self._map.close()
+        except BufferError:
+            # Buffers exported by the map are still alive (e.g. in the traceback
+            # of a failure): it is closed once they are released
+            pass
+
+    def __len__(self) -> int:
+        return self.count
+
+    def find(self, rental_id: int) -> int:
+        """
+        Args:
+            rental_id (int): id of the rental
+        Returns:
+            int: row of the rental, -1 if it is not in the store
+        """
+        if self._index_kind == INDEX_DIRECT:
+            position = rental_id - self._index_base
+            if not 0 <= position < self._index_count:
+                return -1
+            return struct.unpack_from('<q', self._map, self._index_offset + 8 * position)[0]
+        low, high = 0, self._index_count
+        while low < high:
+            middle = (low + high) // 2
+            if INDEX_PAIR.unpack_from(self._map, self._index_offset + middle * INDEX_PAIR.size)[0] < rental_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._index_count:
+            found_id, row = INDEX_PAIR.unpack_from(self._map, self._index_offset + low * INDEX_PAIR.size)
+            if found_id == rental_id:
+                return row
+        return -1
+
+    def _to_request(self, record: tuple) -> RentalRequest:
+        rental_id, car_index, start_day, end_day, distance, options_mask, options_order = record
+        return RentalRequest.from_days(
+            rental_id, self.cars.ids[car_index], start_day, end_day, distance,
+            options_mask, options_order,
+        )
+
+    def get_row(self, row: int) -> RentalRequest:
+        """
+        Args:
+            row (int): row of the rental, in the input order
+        Returns:
+            RentalRequest: the rental of the row
+        """
+        return self._to_request(RENTAL.unpack_from(self._map, self._rentals_offset + row * RENTAL.size))
+
+    def __getitem__(self, rental_id: int) -> RentalRequest:
+        row = self.find(rental_id)
+        if row < 0:
+            raise KeyError(rental_id)
+        return self.get_row(row)
+
+    def __iter__(self) -> Iterator[int]:
+        for row in range(self.count):
+            yield struct.unpack_from('<q', self._map, self._rentals_offset + row * RENTAL.size)[0]
+
+    def values(self) -> Iterator[RentalRequest]:
+        """Lazily read the rentals, in the input order"""
+        for row in range(self.count):
+            yield self.get_row(row)
+
+    def columns(self, start: int, end: int) -> Dict[str, Sequence[int]]:
+        """Read the rows [start, end) by columns: numpy arrays copied from the
+        mapped file when numpy is installed (no view keeps the map exported), lists otherwise
+        Returns:
+            Dict[str, Sequence[int]]: id, car_index, start_day, end_day,
+            distance, options_mask and options_order columns
+        """
+        if np is not None:
+            records = np.frombuffer(
+                self._map, dtype=RENTAL_DTYPE, count=end - start,
+                offset=self._rentals_offset + start * RENTAL.size,
+            ).copy()
+            return {name: records[name] for name in RENTAL_DTYPE.names}
+        records = list(RENTAL.iter_unpack(
+            self._map[self._rentals_offset + start * RENTAL.size:self._rentals_offset + end * RENTAL.size]
+        ))
+        names = ('id', 'car_index', 'start_day', 'end_day', 'distance', 'options_mask', 'options_order')
+        return {name: [record[index] for record in records] for index, name in enumerate(names)}
+
+    def iter_outputs(self, batch_size: int = 1 << 16) -> Iterator[Dict]:
+        """Lazily compute all rentals by batches of rows (see BatchPricing)
+        Args:
+            batch_size (int): number of rentals read and priced at once
+        Yields:
+            Dict: Output of one rental, in the input order
+        """
+        for start in range(0, self.count, batch_size):
+            end = min(start + batch_size, self.count)
+            columns = self.columns(start, end)
+            if np is not None:
+                duration = columns['end_day'] - columns['start_day'] + 1
+            else:
+                duration = [
+                    end_day - start_day + 1
+                    for start_day, end_day in zip(columns['start_day'], columns['end_day'])
+                ]
+            amounts = BatchPricing.compute_columns(
+                self.cars.price_per_day,
+                self.cars.price_per_km,
+                columns['car_index'],
+                duration,
+                columns['distance'],
+                columns['options_mask'],
+            )
+            ids = _to_list(columns['id'])
+            options_masks = _to_list(columns['options_mask'])
+            options_orders = _to_list(columns['options_order'])
+            for index in range(end - start):
+                yield {
+                    'id': ids[index],
+                    'options': RENTAL_OPTIONS.to_options(options_masks[index], options_orders[index]),
+                    'actions': BatchPricing.to_actions(amounts, index),
+                }
+
+
+def _to_list(column: Sequence[int]) -> List[int]:
+    return column.tolist() if np is not None else column
+
+
+def main():
+    """
+    python3 rental_store.py --help
+    """
+    parser = argparse.ArgumentParser(
+        description='Convert an input file into a memory-mapped rental store, or look up a rental in it'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    convert_parser = commands.add_parser('convert', help='Convert an input file into a rental store')
+    convert_parser.add_argument('input', help='Input json file')
+    convert_parser.add_argument('store', help='Rental store to write')
+    convert_parser.add_argument(
+        '--ndjson',
+        action='store_true',
+        help=f'The input holds json lines records tagged by "kind" ({", ".join(NDJSON_KINDS)})'
+    )
+    get_parser = commands.add_parser('get', help='Print the output of one rental of a rental store')
+    get_parser.add_argument('store', help='Rental store')
+    get_parser.add_argument('rental_id', type=int, help='Id of the rental')
+    for subparser in (convert_parser, get_parser):
+        subparser.add_argument(
+            '--options',
+            metavar='PATH',
+            help='Json file with the rental options as [{"type", "price_per_day", "beneficiary"}, ...]'
+        )
+    args = parser.parse_args()
+
+    if args.options is not None:
+        RENTAL_OPTIONS.load(loadJSON(args.options))
+
+    if args.command == 'convert':
+        count = convert(args.input, args.store, args.ndjson)
+        print(f'{count} rentals converted to {args.store}')
+    else:
+        with RentalStore(args.store) as store:
+            if args.rental_id not in store:
+                print(f'Rental {args.rental_id} not found')
+                exit(1)
+            rental_service = Getaround(store.cars.to_cars(), store)
+            print(json.dumps(rental_service.compute_one_rental(args.rental_id), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+from typing import BinaryIO, Dict, Final, Iterable, Optional
+
+from parsing import add_pricing_arguments, load_pricing_config, parse_cars
+from Getaround.Car import Car
+from Getaround.Getaround import Getaround
+from Getaround.RentalRequest import RentalRequest
+
+_encode = json.JSONEncoder(separators=(',', ':')).encode
+
+
+class PricingServer:
+    """Price rentals one by one against cars loaded once.
+        Each request is one rental as a json line, with the fields of the input
+        rentals and an optional "options" list. Each response is one json line:
+        the output of Getaround.compute_one_rental, or {"id", "error"}
+    Usage:
+        server = PricingServer(cars)
+        server.serve_stream(sys.stdin.buffer, sys.stdout.buffer)
+    """
+
+    def __init__(self, cars: Dict[int, Car], cache_size: int = 1 << 16) -> None:
+        self.rental_service = Getaround(cars, {}, cache_size)
+        # The pricing cache is shared by the connections of serve_socket
+        self.lock = threading.Lock()
+
+    def price(self, request: Dict) -> Dict:
+        """
+        Args:
+            request (Dict): rental to price, with an optional "options" list
+        Returns:
+            Dict: output of the rental (see Getaround.compute_one_rental)
+        """
+        rental = RentalRequest(request)
+        rental.options = request.get('options', ())
+        with self.lock:
+            rentals = self.rental_service.rentals
+            rentals[rental.id] = rental
+            try:
+                return self.rental_service.compute_one_rental(rental.id)
+            finally:
+                del rentals[rental.id]
+
+    def handle_line(self, line: bytes) -> bytes:
+        """Answer one request line, errors are answered instead of raised
+        Args:
+            line (bytes): json encoded rental
+        Returns:
+            bytes: json encoded response, ending with a newline
+        """
+        request: Optional[Dict] = None
+        try:
+            request = json.loads(line)
+            response = self.price(request)
+        except Exception as e:
+            rental_id = request.get('id') if isinstance(request, dict) else None
+            response = {'id': rental_id, 'error': f'{type(e).__name__}: {e}'}
+        return _encode(response).encode() + b'\n'
+
+    def serve_stream(self, requests: Iterable[bytes], responses: BinaryIO) -> None:
+        """Answer each request line until the end of the input.
+            Responses are flushed one by one, so clients can wait for them
+        Args:
+            requests (Iterable[bytes]): request lines, e.g. a binary file
+            responses (BinaryIO): where responses are written
+        """
+        for line in requests:
+            if line.strip():
+                responses.write(self.handle_line(line))
+                responses.flush()
+
+    def serve_socket(self, path: str) -> None:
+        """Answer the connections of a unix socket, each one in its own thread,
+        until interrupted. The socket file is removed on exit
+        Args:
+            path (str): path of the unix socket
+        """
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                server.serve_stream(self.rfile, self.wfile)
+
+        if os.path.exists(path):
+            os.unlink(path)
+        with socketserver.ThreadingUnixStreamServer(path, Handler) as unix_server:
+            unix_server.daemon_threads = True
+            try:
+                unix_server.serve_forever()
+            finally:
+                os.unlink(path)
+
+
+def main():
+    """
+    python3 server.py --help
+    """
+    INPUT_PATH: Final = './data/input.json'
+
+    parser = argparse.ArgumentParser(
+        description=f'Load the cars of {INPUT_PATH} once, then price rentals sent as json lines'
+    )
+    parser.add_argument(
+        '--input',
+        default=INPUT_PATH,
+        metavar='PATH',
+        help='Json file the cars are loaded from (its rentals are ignored)'
+    )
+    parser.add_argument(
+        '--socket',
+        metavar='PATH',
+        help='Listen on a unix socket instead of stdin/stdout'
+    )
+    parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=1 << 16,
+        metavar='N',
+        help='Reuse the actions of the N last distinct pricing inputs'
+    )
+    add_pricing_arguments(parser)
+    args = parser.parse_args()
+
+    load_pricing_config(args)
+
+    server = PricingServer(parse_cars(args.input), args.cache_size)
+    if args.socket is None:
+        server.serve_stream(sys.stdin.buffer, sys.stdout.buffer)
+    else:
+        # Stopping the daemon also removes its socket file
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            server.serve_socket(args.socket)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,254 @@
+import argparse
+import json
+import sqlite3
+from typing import Dict, Final, Iterator, List
+
+from parsing import add_pricing_arguments, iter_records, load_pricing_config
+from utils.json import NDJSON_KINDS
+from Getaround.Car import Car
+from Getaround.Getaround import Getaround
+from Getaround.RentalRequest import RentalRequest
+
+# Rows read or written at once
+BATCH_SIZE: Final = 1 << 14
+
+SCHEMA: Final = '''
+CREATE TABLE IF NOT EXISTS cars (
+    id INTEGER PRIMARY KEY,
+    price_per_day INTEGER NOT NULL,
+    price_per_km INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rentals (
+    id INTEGER PRIMARY KEY,
+    car_id INTEGER NOT NULL REFERENCES cars (id),
+    start_date TEXT NOT NULL,
+    end_date TEXT NOT NULL,
+    distance INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rentals_car_id ON rentals (car_id);
+CREATE TABLE IF NOT EXISTS options (
+    id INTEGER PRIMARY KEY,
+    rental_id INTEGER NOT NULL REFERENCES rentals (id),
+    type TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS options_rental_id ON options (rental_id);
+CREATE TABLE IF NOT EXISTS results (
+    rental_id INTEGER PRIMARY KEY REFERENCES rentals (id),
+    options TEXT NOT NULL,
+    actions TEXT NOT NULL
+);
+'''
+
+# Rentals are walked along their primary key, and their options are gathered
+# in id order through the options_rental_id index: no temporary table nor sort is needed
+_SELECT_RENTALS: Final = '''
+SELECT id, car_id, start_date, end_date, distance,
+    (SELECT group_concat(type, ',') FROM (
+        SELECT type FROM options WHERE rental_id = rentals.id ORDER BY id
+    ))
+FROM rentals ORDER BY id
+'''
+
+_INSERTS: Final = {
+    'cars': 'INSERT INTO cars (id, price_per_day, price_per_km) VALUES (:id, :price_per_day, :price_per_km)',
+    'rentals': (
+        'INSERT INTO rentals (id, car_id, start_date, end_date, distance)'
+        ' VALUES (:id, :car_id, :start_date, :end_date, :distance)'
+    ),
+    'options': 'INSERT INTO options (id, rental_id, type) VALUES (:id, :rental_id, :type)',
+}
+
+
+def connect(db_path: str) -> sqlite3.Connection:
+    """Open a database, creating the tables and indexes it misses
+    Args:
+        db_path (str): path of the SQLite database
+    Returns:
+        sqlite3.Connection: connection whose transactions are handled by
+        the with statement
+    """
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def import_input(input_path: str, db_path: str, ndjson: bool = False, batch_size: int = BATCH_SIZE) -> int:
+    """Insert the cars, rentals and options of an input file into a database,
+    element by element and in a single transaction
+    Args:
+        input_path (str): path of the input file
+        db_path (str): path of the SQLite database
+        ndjson (bool): the input holds json lines records (see iterNDJSON)
+        batch_size (int): number of rows inserted at once
+    Returns:
+        int: number of rentals inserted
+    """
+    pending: Dict[str, List[Dict]] = {key: [] for key in _INSERTS}
+    count = 0
+    connection = connect(db_path)
+    try:
+        with connection:
+            for key, item in iter_records(input_path, ndjson):
+                if key not in pending:
+                    continue
+                if key == 'options':
+                    # Json lines options may come without id
+                    item = {'id': None, **item}
+                rows = pending[key]
+                rows.append(item)
+                if len(rows) >= batch_size:
+                    connection.executemany(_INSERTS[key], rows)
+                    rows.clear()
+                count += key == 'rentals'
+            for key, rows in pending.items():
+                connection.executemany(_INSERTS[key], rows)
+    finally:
+        connection.close()
+    return count
+
+
+def load_cars(connection: sqlite3.Connection) -> Dict[int, Car]:
+    """
+    Returns:
+        Dict[int, Car]: Cars by id
+    """
+    return {
+        car_id: Car({'id': car_id, 'price_per_day': price_per_day, 'price_per_km': price_per_km})
+        for car_id, price_per_day, price_per_km in connection.execute(
+            'SELECT id, price_per_day, price_per_km FROM cars'
+        )
+    }
+
+
+def iter_rental_batches(
+    connection: sqlite3.Connection,
+    batch_size: int = BATCH_SIZE,
+) -> Iterator[Dict[int, RentalRequest]]:
+    """Lazily read the rentals with their options, batch_size rows at a time
+    Args:
+        connection (sqlite3.Connection): connection to the database
+        batch_size (int): number of rentals per batch
+    Yields:
+        Dict[int, RentalRequest]: rentals of a batch by id, in id order
+    """
+    cursor = connection.execute(_SELECT_RENTALS)
+    try:
+        for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+            batch: Dict[int, RentalRequest] = {}
+            for rental_id, car_id, start_date, end_date, distance, options in rows:
+                rental = RentalRequest({
+                    'id': rental_id,
+                    'car_id': car_id,
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'distance': distance,
+                })
+                if options is not None:
+                    rental.options = options.split(',')
+                batch[rental_id] = rental
+            yield batch
+    finally:
+        cursor.close()
+
+
+def price_database(db_path: str, batch_size: int = BATCH_SIZE, cache_size: int = 1 << 16) -> int:
+    """Price all rentals of a database into its results table, replacing the
+    previous results in a single transaction. Only the cars and one batch of
+    rentals are held in memory, so databases bigger than memory can be priced
+    Args:
+        db_path (str): path of the SQLite database
+        batch_size (int): number of rentals read, priced and written at once
+        cache_size (int): size of the pricing cache
+    Returns:
+        int: number of rentals priced
+    """
+    encode = json.JSONEncoder(separators=(',', ':')).encode
+    count = 0
+    connection = connect(db_path)
+    try:
+        rental_service = Getaround(load_cars(connection), {}, cache_size)
+        with connection:
+            connection.execute('DELETE FROM results')
+            for batch in iter_rental_batches(connection, batch_size):
+                # The service prices one batch at a time, with the same cache
+                rental_service.rentals = batch
+                connection.executemany(
+                    'INSERT INTO results (rental_id, options, actions) VALUES (?, ?, ?)',
+                    [
+                        (rental['id'], encode(rental['options']), encode(rental['actions']))
+                        for rental in rental_service.iter_rentals()
+                    ],
+                )
+                count += len(batch)
+    finally:
+        connection.close()
+    return count
+
+
+def iter_results(connection: sqlite3.Connection, batch_size: int = BATCH_SIZE) -> Iterator[Dict]:
+    """
+    Args:
+        connection (sqlite3.Connection): connection to the database
+        batch_size (int): number of rows fetched at once
+    Yields:
+        Dict: Output of one rental (same as Getaround.compute_one_rental), in id order
+    """
+    cursor = connection.execute('SELECT rental_id, options, actions FROM results ORDER BY rental_id')
+    try:
+        for rows in iter(lambda: cursor.fetchmany(batch_size), []):
+            for rental_id, options, actions in rows:
+                yield {'id': rental_id, 'options': json.loads(options), 'actions': json.loads(actions)}
+    finally:
+        cursor.close()
+
+
+def main():
+    """
+    python3 sqlite_store.py --help
+    """
+    parser = argparse.ArgumentParser(
+        description='Import an input file into a SQLite database, or price the rentals of a database into its results table'
+    )
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='Insert the cars, rentals and options of an input file')
+    import_parser.add_argument('input', help='Input json file')
+    import_parser.add_argument('database', help='SQLite database, created if needed')
+    import_parser.add_argument(
+        '--ndjson',
+        action='store_true',
+        help=f'The input holds json lines records tagged by "kind" ({", ".join(NDJSON_KINDS)})'
+    )
+    price_parser = commands.add_parser('price', help='Price all rentals into the results table')
+    price_parser.add_argument('database', help='SQLite database')
+    price_parser.add_argument(
+        '--batch-size',
+        type=int,
+        default=BATCH_SIZE,
+        metavar='N',
+        help=f'Number of rentals read, priced and written at once (default {BATCH_SIZE})'
+    )
+    price_parser.add_argument(
+        '--cache-size',
+        type=int,
+        default=1 << 16,
+        metavar='N',
+        help='Reuse the actions of the N last distinct pricing inputs'
+    )
+    add_pricing_arguments(price_parser)
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'import':
+            count = import_input(args.input, args.database, args.ndjson)
+            print(f'{count} rentals imported into {args.database}')
+        else:
+            load_pricing_config(args)
+            count = price_database(args.database, args.batch_size, args.cache_size)
+            print(f'{count} rentals priced into the results table of {args.database}')
+    except sqlite3.Error as e:
+        print(e)
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
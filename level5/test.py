@@ -1,8 +1,37 @@
+import asyncio
+import bz2
+import gzip
+import io
+import json
+import lzma
+import os
+import random
+import tempfile
 import unittest
+from contextlib import redirect_stdout
+from datetime import datetime
 from typing import List
+from unittest import mock
+from parsing import parse_input, parse_input_stream, parse_input_table, parse_cars
+from parallel import iter_rentals_parallel, iter_table_parallel
+from check_cents import iter_mismatches
+from delta import save_delta
+from input_cache import load_cache, parse_input_cached
+from lookup import OutputLookup, lookup_rental
+from rental_store import RentalStore, convert, is_rental_store
+from sqlite_store import connect, import_input, iter_rental_batches, iter_results, price_database
+from server import PricingServer
+from quote_server import QuoteBatcher
+from utils.sidecar import RentalIndex, RentalIndexWriter
+from utils.json import loadJSON, loadNDJSON, saveJSON, iterJSON, iterNDJSON, NDJSONWriter, RentalsWriter
+from utils.encoder import encode_output, encode_rental
+from utils.profiling import StageProfiler
 from Getaround.Getaround import Getaround
 from Getaround.RentalRequest import RentalRequest, RentalRequestInit
 from Getaround.Car import Car
+from Getaround.DiscountCurve import DiscountCurve
+from Getaround.BatchPricing import BatchPricing
+from Getaround.RentalOptions import RENTAL_OPTIONS, RentalOptionRegistry
 
 cars = [
     Car({"id": 1, "price_per_day": 2000, "price_per_km": 10}),
@@ -18,6 +47,10 @@ rentals: List[RentalRequestInit] = [
 ]
 
 
+def attributes(row) -> dict:
+    return {name: getattr(row, name) for name in row.__slots__}
+
+
 class TestRentalRequest(unittest.TestCase):
     def test_duration(self):
         config = (
@@ -34,6 +67,26 @@ class TestRentalRequest(unittest.TestCase):
             RentalRequest({"id": 1, "car_id": 1, "start_date": "2015-12-8",
                            "end_date": "2015-12-2", "distance": 100})
 
+    def test_parse_date(self):
+        for date_string in ('2015-12-8', '2015-03-31', '2016-2-29'):
+            self.assertEqual(
+                RentalRequest.parse_date(date_string),
+                datetime.strptime(date_string, '%Y-%m-%d').date())
+        for date_string in (
+            '2015-2-29', '2015-12', 'not-a-date', ' 2015-+12-08 ', '2015-12-08 ',
+            '15-12-08', '2015-012-08', '2015-12-',
+        ):
+            with self.assertRaises(ValueError):
+                RentalRequest.parse_date(date_string)
+
+    def test_durations(self):
+        durations = RentalRequest.get_durations(
+            [rental['start_date'] for rental in rentals],
+            [rental['end_date'] for rental in rentals])
+        self.assertEqual(list(durations), [1, 2, 12])
+        with self.assertRaises(ValueError):
+            RentalRequest.get_durations(['2015-12-8'], ['2015-12-2'])
+
 
 class TestGetaround(unittest.TestCase):
     def test_price_per_day(self):
@@ -46,6 +99,29 @@ class TestGetaround(unittest.TestCase):
             res = Getaround.get_price_per_day(duration, car_price)
             self.assertEqual(res, expected)
 
+    def test_discount_curve(self):
+        curve = DiscountCurve([(1.0, 0), (0.9, 1), (0.5, 10), (0.7, 4)])
+        for duration in (40, 1, 12, 5):
+            for car_price in (30, 2000, 12345):
+                self.assertEqual(
+                    curve.get_price(duration, car_price),
+                    curve.compute(duration, car_price))
+        # Float truncation is kept: 7.9 * 30 gives 236 cents
+        self.assertEqual(curve.get_price(10, 30), 236)
+        self.assertEqual(DiscountCurve([(1.0, 0)]).get_price(12, 2000), 24000)
+        with self.assertRaises(ValueError):
+            DiscountCurve([(0.5, 10)])
+
+    def test_discount_curve_bounds(self):
+        curve = DiscountCurve()
+        # e.g. an end date with a typo in the year
+        duration = 2_500_000
+        self.assertEqual(curve.get_price(duration, 2000), curve.compute(duration, 2000))
+        self.assertEqual(curve._prices, {})
+        for car_price in range(DiscountCurve.MAX_TABLES + 10):
+            self.assertEqual(curve.get_price(12, car_price), curve.compute(12, car_price))
+        self.assertEqual(len(curve._prices), DiscountCurve.MAX_TABLES)
+
     def test_price(self):
         config = (
             (0, 0, 3000),
@@ -107,6 +183,736 @@ class TestGetaround(unittest.TestCase):
         self.assertEqual(transactions['assistance'], 100)
         self.assertEqual(transactions['drivy'], 1350)
 
+    def test_iter_rentals(self):
+        rental_service = Getaround(
+            {car.id: car for car in cars},
+            {rental['id']: RentalRequest(rental) for rental in rentals}
+        )
+        iterator = rental_service.iter_rentals()
+        self.assertEqual(next(iterator)['id'], 1)
+        self.assertEqual(rental_service.output, [])
+        self.assertEqual(
+            [rental['id'] for rental in rental_service.compute_rentals()],
+            [1, 2, 3]
+        )
+
+    def test_registered_option(self):
+        definitions = RENTAL_OPTIONS.definitions()
+        try:
+            RENTAL_OPTIONS.register(
+                {'type': 'snow_chains', 'price_per_day': 300, 'beneficiary': 'insurance'})
+            rental = RentalRequest(rentals[0])
+            rental.options = ['snow_chains', 'gps']
+            self.assertEqual(rental.options, ('snow_chains', 'gps'))
+            # The options are not a list that could be appended to in vain
+            with self.assertRaises(AttributeError):
+                rental.options.append('gps')
+            price = Getaround.get_price(rental, cars[0])
+            transactions = Getaround.get_transactions(price, rental.duration)
+            Getaround.apply_rental_options(transactions, rental)
+            self.assertEqual(transactions['driver'], -3800)
+            self.assertEqual(transactions['owner'], 2600)
+            self.assertEqual(transactions['insurance'], 750)
+        finally:
+            RENTAL_OPTIONS.load(definitions)
+
+    def test_options_input_order(self):
+        data = loadJSON('./data/input.json')
+        data['options'] = [
+            {"id": 1, "rental_id": 1, "type": "baby_seat"},
+            {"id": 2, "rental_id": 1, "type": "additional_insurance"},
+            {"id": 3, "rental_id": 1, "type": "gps"},
+            {"id": 4, "rental_id": 2, "type": "gps"},
+            {"id": 5, "rental_id": 2, "type": "baby_seat"},
+        ]
+        expected = [
+            ['baby_seat', 'additional_insurance', 'gps'], ['gps', 'baby_seat'], [],
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            input_path = os.path.join(directory, 'input.json')
+            saveJSON(data, input_path)
+            car_by_id, rental_by_id = parse_input(input_path)
+            outputs = Getaround(car_by_id, rental_by_id).compute_rentals()
+            self.assertEqual([output['options'] for output in outputs], expected)
+            self.assertEqual(outputs[0]['actions'][0]['amount'], 3000 + 1700 * 1)
+            _, stream_rentals = parse_input_stream(input_path)
+            self.assertEqual([list(rental.options) for rental in stream_rentals.values()], expected)
+            car_table, rental_table = parse_input_table(input_path)
+            self.assertEqual(list(BatchPricing.iter_table(car_table, rental_table)), outputs)
+            store_path = os.path.join(directory, 'input.store')
+            convert(input_path, store_path)
+            with RentalStore(store_path) as store:
+                self.assertEqual(list(store.iter_outputs()), outputs)
+            db_path = os.path.join(directory, 'input.db')
+            import_input(input_path, db_path)
+            price_database(db_path)
+            connection = connect(db_path)
+            try:
+                self.assertEqual(list(iter_results(connection)), outputs)
+            finally:
+                connection.close()
+
+            # An option selected twice is rejected instead of being charged twice
+            data['options'].append({"id": 6, "rental_id": 2, "type": "gps"})
+            saveJSON(data, input_path)
+            with self.assertRaises(ValueError):
+                parse_input(input_path)
+
+    def test_option_registry_errors(self):
+        registry = RentalOptionRegistry()
+        registry.register({'type': 'gps', 'price_per_day': 500, 'beneficiary': 'owner'})
+        with self.assertRaises(ValueError):
+            registry.register({'type': 'gps', 'price_per_day': 1, 'beneficiary': 'owner'})
+        with self.assertRaises(ValueError):
+            registry.register({'type': 'wifi', 'price_per_day': 1, 'beneficiary': 'driver'})
+        with self.assertRaises(Exception):
+            registry.to_mask(['wifi'])
+
+    def test_transactions_cents(self):
+        self.assertEqual(
+            Getaround.get_transactions_cents(3000, 1),
+            {'driver': -3000, 'owner': 2100, 'insurance': 450,
+             'assistance': 100, 'drivy': 350})
+        with self.assertRaises(Exception):
+            Getaround.get_transactions_cents(3000, 5)
+        # Getaround.get_transactions against get_transactions_cents
+        self.assertEqual(list(iter_mismatches(2000, 12, ['scalar'])), [])
+        # Float against integer paths of BatchPricing.compute_transactions
+        self.assertEqual(list(iter_mismatches(5000, 12, ['batch'])), [])
+
+    def test_pricing_cache(self):
+        car = Car({"id": 1, "price_per_day": 2000, "price_per_km": 10})
+        rental_service = Getaround(
+            {1: car},
+            {rental_id: RentalRequest(dict(rentals[0], id=rental_id))
+             for rental_id in range(1, 5)},
+            cache_size=2)
+        outputs = rental_service.compute_rentals()
+        self.assertEqual(rental_service.cache.info(),
+                         {'hits': 3, 'misses': 1, 'size': 1, 'maxsize': 2})
+        self.assertEqual(outputs[3]['actions'][0]['amount'], 3000)
+        # Outputs sharing cached actions are modified on their own
+        outputs[3]['actions'][0]['amount'] = 0
+        outputs[3]['actions'].pop()
+        self.assertEqual(outputs[2]['actions'], outputs[1]['actions'])
+        self.assertEqual(rental_service.compute_one_rental(3)['actions'], outputs[1]['actions'])
+
+        car.price_per_day = 1000
+        self.assertEqual(rental_service.compute_one_rental(1)['actions'][0]['amount'], 2000)
+        self.assertEqual(rental_service.cache.misses, 2)
+
+        Getaround.set_discounts(DiscountCurve().discounts)
+        rental_service.compute_one_rental(1)
+        self.assertEqual(rental_service.cache.info()['size'], 1)
+        self.assertEqual(rental_service.cache.misses, 3)
+
+    def test_incremental_repricing(self):
+        rental_service = Getaround(
+            {1: Car({"id": 1, "price_per_day": 2000, "price_per_km": 10}),
+             2: Car({"id": 2, "price_per_day": 1000, "price_per_km": 10})},
+            {rental['id']: RentalRequest(rental) for rental in rentals})
+        rental_service.compute_rentals()
+
+        changes = rental_service.update_car(
+            Car({"id": 1, "price_per_day": 2000, "price_per_km": 20}))
+        self.assertEqual(list(changes), [1, 2, 3])
+        self.assertEqual(changes[1]['actions'][0]['amount'], 4000)
+        self.assertEqual(rental_service.update_car(
+            Car({"id": 2, "price_per_day": 500, "price_per_km": 10})), {})
+
+        changes = rental_service.add_rental(RentalRequest(dict(rentals[0], id=4, car_id=2)))
+        self.assertEqual(changes[4]['actions'][0]['amount'], 1500)
+        self.assertEqual(list(rental_service.update_car(
+            Car({"id": 2, "price_per_day": 600, "price_per_km": 10}))), [4])
+
+        changes = rental_service.add_option(4, 'gps')
+        self.assertEqual(changes[4]['options'], ['gps'])
+        with self.assertRaises(ValueError):
+            rental_service.add_option(4, 'gps')
+        self.assertEqual(rental_service.rentals[4].options, ('gps',))
+        self.assertEqual(rental_service.remove_rental(4), {4: None})
+        self.assertEqual(rental_service.rentals_by_car[2], set())
+
+    def test_remove_only_rental_of_car(self):
+        # The reverse index is not built yet
+        rental_service = Getaround(
+            {1: Car({"id": 1, "price_per_day": 2000, "price_per_km": 10})},
+            {1: RentalRequest(rentals[0])})
+        self.assertEqual(rental_service.remove_rental(1), {1: None})
+        self.assertEqual(rental_service.rentals, {})
+        self.assertEqual(rental_service.rentals_by_car[1], set())
+
+
+class TestParallel(unittest.TestCase):
+    def test_same_order_as_serial(self):
+        car_by_id = {car.id: car for car in cars}
+        many_rentals = {}
+        for rental_id in range(1, 200):
+            rental = RentalRequest(dict(rentals[rental_id % 3], id=rental_id))
+            rental.options_mask = rental_id % 8
+            many_rentals[rental_id] = rental
+        self.assertEqual(
+            list(iter_rentals_parallel(car_by_id, many_rentals, 2, shard_size=16)),
+            Getaround(car_by_id, many_rentals).compute_rentals())
+
+    def test_shared_memory_tables(self):
+        car_table, rental_table = parse_input_table('./data/input.json')
+        for _ in range(5):
+            for index in range(3):
+                rental = rental_table.to_request(index, car_table)
+                rental_table.append({
+                    'id': rental_table.ids[-1] + 1, 'car_id': rental.car_id,
+                    'start_date': rental.start_date.isoformat(),
+                    'end_date': rental.end_date.isoformat(),
+                    'distance': rental.distance,
+                })
+                rental_table.options_mask[-1] = rental_table.options_mask[index]
+        rental_table.resolve_cars(car_table)
+        self.assertEqual(
+            list(iter_table_parallel(car_table, rental_table, 2, shard_size=4)),
+            list(BatchPricing.iter_table(car_table, rental_table)))
+
+
+class TestBatchPricing(unittest.TestCase):
+    def test_same_as_scalar(self):
+        rng = random.Random(42)
+        columns = ([], [], [], [], [])
+        expected = []
+        for _ in range(2000):
+            car = Car({'id': 1, 'price_per_day': rng.randrange(500, 10000, 10),
+                       'price_per_km': rng.randrange(1, 50)})
+            rental = RentalRequest({'id': 1, 'car_id': 1, 'start_date': '2015-1-1',
+                                    'end_date': '2015-1-1', 'distance': rng.randrange(1000)})
+            rental.duration = rng.randrange(1, 30)
+            mask = rng.randrange(1 << len(RENTAL_OPTIONS.fees))
+            rental.options_mask = mask
+            try:
+                price = Getaround.get_price(rental, car)
+                transactions = Getaround.get_transactions(price, rental.duration)
+            except Exception:
+                continue
+            Getaround.apply_rental_options(transactions, rental)
+            expected.append(Getaround.transactions_to_action(transactions))
+            for column, value in zip(columns, (car.price_per_day, car.price_per_km,
+                                               rental.duration, rental.distance, mask)):
+                column.append(value)
+
+        for compute in (BatchPricing.compute, BatchPricing._compute_python):
+            amounts = compute(*columns)
+            for index, actions in enumerate(expected):
+                self.assertEqual(BatchPricing.to_actions(amounts, index), actions)
+
+    def test_exception_commission(self):
+        with self.assertRaises(Exception):
+            BatchPricing.compute([1000], [10], [31], [100], [0])
+
+
+class TestParsing(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_iter_json_chunks(self):
+        data = loadJSON('./data/input.json')
+        expected = [(key, item) for key, items in data.items() for item in items]
+        for chunk_size in (1, 7, 1 << 16):
+            items = list(iterJSON('./data/input.json', chunk_size))
+            self.assertEqual(items, expected)
+
+    def test_stream_equals_load(self):
+        cars, rentals = parse_input('./data/input.json')
+        stream_cars, stream_rentals = parse_input_stream('./data/input.json')
+        self.assertEqual(cars.keys(), stream_cars.keys())
+        for rental_id, rental in rentals.items():
+            self.assertEqual(
+                attributes(rental), attributes(stream_rentals[rental_id]))
+
+    def test_stream_options_before_rentals(self):
+        with open(self.path, 'w') as fd:
+            json.dump({
+                'options': [
+                    {'id': 1, 'rental_id': 2, 'type': 'gps'},
+                    {'id': 2, 'rental_id': 2, 'type': 'baby_seat'},
+                ],
+                'rentals': rentals[:2],
+                'cars': [{'id': 1, 'price_per_day': 2000, 'price_per_km': 10}],
+            }, fd)
+        cars, stream_rentals = parse_input_stream(self.path)
+        self.assertEqual(list(cars), [1])
+        self.assertEqual(stream_rentals[1].options, ())
+        self.assertEqual(stream_rentals[2].options, ('gps', 'baby_seat'))
+
+    def test_table_equals_load(self):
+        cars, rentals = parse_input('./data/input.json')
+        car_table, rental_table = parse_input_table('./data/input.json')
+        self.assertEqual(len(rental_table), len(rentals))
+        for index, rental_id in enumerate(rental_table.ids):
+            self.assertEqual(
+                attributes(rental_table.to_request(index, car_table)),
+                attributes(rentals[rental_id]))
+        self.assertEqual(
+            list(BatchPricing.iter_table(car_table, rental_table)),
+            loadJSON('./data/expected_output.json')['rentals'])
+
+    def test_rentals_writer_layout(self):
+        expected = loadJSON('./data/expected_output.json')['rentals']
+        for count in (0, 1, len(expected)):
+            with RentalsWriter(self.path) as writer:
+                for rental in expected[:count]:
+                    writer.write(rental)
+            with open(self.path, 'r') as fd:
+                self.assertEqual(
+                    fd.read(),
+                    json.dumps({'rentals': expected[:count]}, indent=2) + '\n'
+                )
+
+    def test_rentals_writer_failure(self):
+        expected = loadJSON('./data/expected_output.json')['rentals']
+        saveJSON({'rentals': expected}, self.path)
+        with open(self.path, 'rb') as fd:
+            previous = fd.read()
+        with self.assertRaises(ValueError):
+            with RentalsWriter(self.path, atomic=True) as writer:
+                writer.write(expected[0])
+                raise ValueError('drivy_fee are negative')
+        with open(self.path, 'rb') as fd:
+            self.assertEqual(fd.read(), previous)
+        self.assertFalse(os.path.exists(self.path + '.tmp'))
+
+    def test_ndjson(self):
+        data = loadJSON('./data/input.json')
+        with open(self.path, 'w') as fd:
+            for key, kind in (('options', 'option'), ('cars', 'car'), ('rentals', 'rental')):
+                for item in data[key]:
+                    fd.write(json.dumps(dict(item, kind=kind)) + '\n')
+        cars, rentals = parse_input('./data/input.json')
+        ndjson_cars, ndjson_rentals = parse_input_stream(self.path, ndjson=True)
+        self.assertEqual(cars.keys(), ndjson_cars.keys())
+        for rental_id, rental in rentals.items():
+            self.assertEqual(attributes(rental), attributes(ndjson_rentals[rental_id]))
+        car_table, rental_table = parse_input_table(self.path, ndjson=True)
+        self.assertEqual(list(rental_table.ids), list(rentals))
+
+        expected = loadJSON('./data/expected_output.json')['rentals']
+        with NDJSONWriter(self.path) as writer:
+            for rental in expected:
+                writer.write(rental)
+        self.assertEqual(loadNDJSON(self.path), expected)
+        with open(self.path, 'r') as fd:
+            self.assertEqual(len(fd.readlines()), len(expected))
+
+    def test_compressed_files(self):
+        data = loadJSON('./data/input.json')
+        expected = list(iterJSON('./data/input.json'))
+        with tempfile.TemporaryDirectory() as directory:
+            for extension, magic in (('.gz', b'\x1f\x8b'), ('.bz2', b'BZh'), ('.xz', b'\xfd7zXZ')):
+                path = os.path.join(directory, 'input.json' + extension)
+                saveJSON(data, path, compresslevel=1)
+                with open(path, 'rb') as fd:
+                    self.assertEqual(fd.read(len(magic)), magic)
+                # Detected by magic bytes whatever the extension
+                renamed = os.path.join(directory, 'input' + extension.replace('.', '_'))
+                os.rename(path, renamed)
+                self.assertEqual(loadJSON(renamed), data)
+                self.assertEqual(list(iterJSON(renamed, chunk_size=7)), expected)
+
+    def test_compressed_stdin(self):
+        data = loadJSON('./data/input.json')
+        lines = ''.join(
+            json.dumps(dict(item, kind=kind)) + '\n'
+            for key, kind in (('cars', 'car'), ('rentals', 'rental'), ('options', 'option'))
+            for item in data[key]
+        ).encode()
+        expected = [(key, item) for key in ('cars', 'rentals', 'options') for item in data[key]]
+        for content in (lines, gzip.compress(lines), bz2.compress(lines), lzma.compress(lines)):
+            stdin = io.TextIOWrapper(io.BufferedReader(io.BytesIO(content)))
+            with mock.patch('sys.stdin', stdin):
+                self.assertEqual(list(iterNDJSON('-')), expected)
+            self.assertFalse(stdin.closed)
+
+
+class TestEncoder(unittest.TestCase):
+    def test_expected_outputs_of_all_levels(self):
+        for level in range(1, 6):
+            path = f'../level{level}/data/expected_output.json'
+            with open(path, 'rb') as fd:
+                self.assertEqual(encode_output(loadJSON(path)), fd.read(), path)
+
+    def test_other_shapes(self):
+        for output in (
+            {'rentals': []},
+            {'rentals': [{}, {'id': 1, 'price': 2.5}, {'id': True, 'actions': []}]},
+            {'rentals': [{'id': 1, 'options': ['si\u00e8ge', 'a"b'], 'commission': {}}]},
+            {'rentals': [{'id': 1, 'actions': [{'who': 'owner', 'amount': 1, 'type': 'credit'}]}]},
+            {'rentals': [{'id': 1, 'extra': None}], 'total': 1},
+            [1, 'two'],
+        ):
+            self.assertEqual(encode_output(output), (json.dumps(output, indent=2) + '\n').encode())
+        rental = {'id': 1, 'options': [], 'actions': [{'who': 'driver', 'type': 'debit', 'amount': 1}]}
+        self.assertEqual(encode_rental(rental),
+                         json.dumps(rental, indent=2).replace('\n', '\n    ').encode())
+
+
+class TestInputCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'input.json')
+        with open('./data/input.json', 'rb') as source, open(self.path, 'wb') as fd:
+            fd.write(source.read())
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertSameTables(self, tables, expected):
+        for table, expected_table in zip(tables, expected):
+            self.assertEqual(table.columns(), expected_table.columns())
+
+    def test_cache_reuse(self):
+        self.assertIsNone(load_cache(self.path))
+        expected = parse_input_table(self.path)
+        self.assertSameTables(parse_input_cached(self.path), expected)
+        car_table, rental_table = load_cache(self.path)
+        self.assertSameTables((car_table, rental_table), expected)
+        car_by_id, rental_by_id = parse_input(self.path)
+        self.assertEqual(list(car_table.to_cars()), list(car_by_id))
+        for rental_id, rental in rental_table.to_requests(car_table).items():
+            self.assertEqual(attributes(rental), attributes(rental_by_id[rental_id]))
+        self.assertIsNone(load_cache(self.path, ndjson=True))
+
+        # Same content with another mtime is still valid
+        os.utime(self.path, ns=(0, 0))
+        self.assertIsNotNone(load_cache(self.path))
+
+    def test_cache_invalidation(self):
+        parse_input_cached(self.path)
+        stat = os.stat(self.path)
+        with open(self.path, 'r+') as fd:
+            content = fd.read().replace('"distance": 100', '"distance": 900')
+            fd.seek(0)
+            fd.write(content)
+        # Same size and mtime are not trusted when the content changed
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+        self.assertIsNone(load_cache(self.path))
+        car_table, rental_table = parse_input_cached(self.path)
+        self.assertEqual(rental_table.distance[0], 900)
+
+        definitions = RENTAL_OPTIONS.definitions()
+        try:
+            RENTAL_OPTIONS.load(definitions[::-1])
+            self.assertIsNone(load_cache(self.path))
+        finally:
+            RENTAL_OPTIONS.load(definitions)
+        self.assertIsNotNone(load_cache(self.path))
+
+    def test_input_changed_while_parsing(self):
+        def parse_then_change(input_path, ndjson=False):
+            tables = parse_input_table(input_path, ndjson)
+            with open(input_path, 'r+') as fd:
+                content = fd.read().replace('"distance": 100', '"distance": 900')
+                fd.seek(0)
+                fd.write(content)
+            return tables
+
+        with mock.patch('input_cache.parse_input_table', parse_then_change):
+            car_table, rental_table = parse_input_cached(self.path)
+        self.assertEqual(rental_table.distance[0], 100)
+        # The tables of the previous content are not trusted for the new one
+        self.assertIsNone(load_cache(self.path))
+        car_table, rental_table = parse_input_cached(self.path)
+        self.assertEqual(rental_table.distance[0], 900)
+
+
+class TestRentalStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'input.store')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_convert(self):
+        self.assertFalse(is_rental_store('./data/input.json'))
+        self.assertEqual(convert('./data/input.json', self.path), 3)
+        self.assertTrue(is_rental_store(self.path))
+        expected = loadJSON('./data/expected_output.json')['rentals']
+        car_by_id, rental_by_id = parse_input('./data/input.json')
+        with RentalStore(self.path) as store:
+            self.assertEqual(list(store.iter_outputs(batch_size=2)), expected)
+            self.assertEqual(list(store), list(rental_by_id))
+            for rental_id, rental in rental_by_id.items():
+                self.assertEqual(attributes(store[rental_id]), attributes(rental))
+            self.assertNotIn(0, store)
+            self.assertEqual(store.find(4), -1)
+            rental_service = Getaround(store.cars.to_cars(), store)
+            self.assertEqual(rental_service.compute_rentals(), expected)
+
+    def test_sparse_ids(self):
+        input_path = os.path.join(self.directory.name, 'input.json')
+        saveJSON({
+            'cars': [{"id": 7, "price_per_day": 2000, "price_per_km": 10}],
+            'rentals': [
+                {**rental, 'id': rental_id, 'car_id': 7}
+                for rental, rental_id in zip(rentals, (10 ** 9, 5, -3))
+            ],
+            'options': [{"id": 1, "rental_id": 5, "type": "gps"}],
+        }, input_path)
+        convert(input_path, self.path)
+        with RentalStore(self.path) as store:
+            self.assertEqual(list(store), [10 ** 9, 5, -3])
+            self.assertEqual(store.find(-3), 2)
+            self.assertEqual(store.find(6), -1)
+            self.assertEqual(store[5].options_mask, RENTAL_OPTIONS.to_mask(['gps']))
+            self.assertEqual(
+                list(store.iter_outputs()),
+                Getaround(*parse_input(input_path)).compute_rentals(),
+            )
+
+    def test_failed_pricing(self):
+        input_path = os.path.join(self.directory.name, 'input.json')
+        saveJSON({
+            'cars': [{"id": 1, "price_per_day": 100, "price_per_km": 0}],
+            'rentals': [dict(rentals[0], car_id=1)],
+        }, input_path)
+        convert(input_path, self.path)
+        # The pricing error is not hidden by the closing of the store
+        with self.assertRaisesRegex(Exception, 'drivy_fee are negative'):
+            with RentalStore(self.path) as store:
+                list(store.iter_outputs())
+        store.close()
+
+
+class TestSQLiteStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'input.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_import(self):
+        self.assertEqual(import_input('./data/input.json', self.path, batch_size=2), 3)
+        car_by_id, rental_by_id = parse_input('./data/input.json')
+        connection = connect(self.path)
+        try:
+            batches = list(iter_rental_batches(connection, batch_size=2))
+            self.assertEqual([len(batch) for batch in batches], [2, 1])
+            for batch in batches:
+                for rental_id, rental in batch.items():
+                    self.assertEqual(attributes(rental), attributes(rental_by_id[rental_id]))
+        finally:
+            connection.close()
+
+    def test_price(self):
+        import_input('./data/input.json', self.path)
+        expected = loadJSON('./data/expected_output.json')['rentals']
+        for batch_size in (1, 1 << 14):
+            # Results of the previous run are replaced
+            self.assertEqual(price_database(self.path, batch_size), 3)
+            connection = connect(self.path)
+            try:
+                self.assertEqual(list(iter_results(connection)), expected)
+            finally:
+                connection.close()
+
+
+class TestDelta(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'output.json')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_delta_runs(self):
+        car_by_id, rental_by_id = parse_input('./data/input.json')
+        rental_service = Getaround(car_by_id, rental_by_id)
+        self.assertEqual(save_delta(rental_service, self.path), (3, 0))
+        self.assertEqual(save_delta(rental_service, self.path), (0, 3))
+
+        rental_service.update_car(Car({"id": 1, "price_per_day": 2000, "price_per_km": 20}))
+        rental_service.add_rental(RentalRequest(dict(rentals[0], id=4)))
+        rental_service.add_option(3, 'gps')
+        rental_service.remove_rental(2)
+        rental_service.update_car(Car({"id": 1, "price_per_day": 2000, "price_per_km": 10}))
+        self.assertEqual(save_delta(rental_service, self.path), (2, 1))
+        with open(self.path, 'r') as fd:
+            self.assertEqual(
+                fd.read(),
+                json.dumps({'rentals': rental_service.compute_rentals()}, indent=2) + '\n')
+
+    def test_output_rewritten_without_index(self):
+        car_by_id, rental_by_id = parse_input('./data/input.json')
+        rental_service = Getaround(car_by_id, rental_by_id)
+        save_delta(rental_service, self.path)
+        index_path = self.path + '.idx'
+        with open(index_path, 'rb') as fd:
+            index = fd.read()
+        # e.g. a run that failed halfway through the output
+        with open(self.path, 'r+b') as fd:
+            fd.truncate(596)
+        with open(index_path, 'wb') as fd:
+            fd.write(index)
+        self.assertEqual(save_delta(rental_service, self.path), (3, 0))
+        self.assertEqual(loadJSON(self.path), {'rentals': rental_service.compute_rentals()})
+
+    def test_sparse_index(self):
+        rental_ids = (30, 10, 20, 60, 50, 40, 70)
+        for run_size in (len(rental_ids), 2):
+            # Sorted in memory, or by runs merged on disk
+            writer = RentalIndexWriter(self.path, run_size)
+            for rental_id in rental_ids:
+                writer.add(rental_id, rental_id * 100, rental_id, bytes([rental_id]))
+            writer.save()
+            with RentalIndex(self.path) as index:
+                self.assertEqual(len(index), len(rental_ids))
+                self.assertEqual([index._id_at(position) for position in range(len(index))],
+                                 sorted(rental_ids))
+                self.assertEqual(index.get(20).offset, 2000)
+                self.assertEqual(index.get(30).digest[0], 30)
+                self.assertIsNone(index.get(15))
+            self.assertFalse(os.path.exists(self.path + '.sort'))
+
+
+class TestLookup(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.expected = loadJSON('./data/expected_output.json')['rentals']
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def assertLookups(self, path):
+        with OutputLookup(path) as lookup:
+            for rental in self.expected[::-1]:
+                self.assertEqual(lookup.get(rental['id']), rental)
+            self.assertIsNone(lookup.get(0))
+
+    def test_json_output(self):
+        for name in ('output.json', 'output.json.gz'):
+            path = os.path.join(self.directory.name, name)
+            with RentalsWriter(path, path + '.idx') as writer:
+                for rental in self.expected:
+                    writer.write(rental)
+            self.assertLookups(path)
+
+    def test_ndjson_output(self):
+        path = os.path.join(self.directory.name, 'output.ndjson')
+        with NDJSONWriter(path, index_path=path + '.idx') as writer:
+            for rental in self.expected:
+                writer.write(rental)
+        self.assertLookups(path)
+
+    def test_stale_index(self):
+        path = os.path.join(self.directory.name, 'output.json')
+        with RentalsWriter(path, path + '.idx') as writer:
+            for rental in self.expected:
+                writer.write(rental)
+        saveJSON({'rentals': self.expected[1:]}, path)
+        with self.assertRaises(ValueError):
+            lookup_rental(path, 2)
+
+    def test_failed_run_removes_index(self):
+        path = os.path.join(self.directory.name, 'output.json')
+        for atomic in (False, True):
+            with RentalsWriter(path, path + '.idx') as writer:
+                for rental in self.expected:
+                    writer.write(rental)
+            with self.assertRaises(ValueError):
+                with RentalsWriter(path, path + '.idx', atomic=atomic) as writer:
+                    writer.write(self.expected[0])
+                    raise ValueError('drivy_fee are negative')
+            self.assertFalse(os.path.exists(path + '.idx'))
+
+
+class TestProfiling(unittest.TestCase):
+    def test_stages(self):
+        profiler = StageProfiler(enabled=True, latency=True)
+        with profiler.stage('parse'):
+            car_by_id, rental_by_id = parse_input('./data/input.json')
+        output = Getaround(car_by_id, rental_by_id).iter_rentals()
+        computed = profiler.iter_stage('compute', output)
+        count = profiler.wrap('save', len)
+        for rental in computed:
+            count(rental)
+        self.assertEqual(list(profiler.stages), ['parse', 'compute', 'save'])
+        self.assertEqual([stats.calls for stats in profiler.stages.values()], [1, 3, 3])
+        self.assertEqual(len(profiler.latency), 3)
+        self.assertIn('Latency per rental:', profiler.report())
+
+    def test_disabled(self):
+        profiler = StageProfiler()
+        items = [1, 2]
+        self.assertIs(profiler.wrap('save', len), len)
+        self.assertEqual(list(profiler.iter_stage('compute', items)), items)
+        with profiler.stage('parse'):
+            pass
+        self.assertEqual(profiler.stages, {})
+
+    def test_report_stream(self):
+        stream = io.StringIO()
+        with redirect_stdout(io.StringIO()) as stdout:
+            with StageProfiler(enabled=True, stream=stream) as profiler:
+                with profiler.stage('parse'):
+                    pass
+        self.assertEqual(stdout.getvalue(), '')
+        self.assertIn('parse', stream.getvalue())
+
+
+class TestServer(unittest.TestCase):
+    def test_serve_stream(self):
+        car_by_id, rental_by_id = parse_input('./data/input.json')
+        expected = Getaround(car_by_id, rental_by_id).compute_rentals()
+        data = loadJSON('./data/input.json')
+        for rental in data['rentals']:
+            rental['options'] = [
+                opt['type'] for opt in data['options'] if opt['rental_id'] == rental['id']
+            ]
+        requests = [json.dumps(rental).encode() + b'\n' for rental in data['rentals']]
+        requests += [b'\n', b'{"id": 9, "car_id": 42}\n']
+
+        server = PricingServer(parse_cars('./data/input.json'))
+        responses = io.BytesIO()
+        server.serve_stream(requests, responses)
+        lines = [json.loads(line) for line in responses.getvalue().splitlines()]
+        self.assertEqual(lines[:-1], expected)
+        self.assertEqual(lines[-1]['id'], 9)
+        self.assertIn('error', lines[-1])
+        self.assertEqual(server.rental_service.rentals, {})
+
+
+class TestQuoteServer(unittest.TestCase):
+    def test_batched_quotes(self):
+        car_by_id, rental_by_id = parse_input('./data/input.json')
+        expected = Getaround(car_by_id, rental_by_id).compute_rentals()
+        data = loadJSON('./data/input.json')
+        requests = [dict(rental, options=output['options'])
+                    for rental, output in zip(data['rentals'], expected)]
+        cheap_car = Car({"id": 42, "price_per_day": 100, "price_per_km": 0})
+        batcher = QuoteBatcher({**car_by_id, 42: cheap_car}, max_batch=2)
+
+        async def quote_all():
+            return await asyncio.gather(
+                *(batcher.quote(request) for request in requests),
+                batcher.quote(dict(requests[0], car_id=42)),
+                return_exceptions=True,
+            )
+        quotes = asyncio.run(quote_all())
+        self.assertEqual([quote['actions'] for quote in quotes[:-1]],
+                         [output['actions'] for output in expected])
+        self.assertEqual([quote['options'] for quote in quotes[:-1]],
+                         [output['options'] for output in expected])
+        self.assertEqual(quotes[0]['price'], expected[0]['actions'][0]['amount'])
+        # The negative drivy fee only fails its own quote
+        self.assertIsInstance(quotes[-1], Exception)
+        self.assertEqual(batcher.batches, 2)
+        with self.assertRaises(ValueError):
+            batcher.get_inputs(dict(requests[0], distance=True))
+        with self.assertRaises(KeyError):
+            batcher.get_inputs(dict(requests[0], car_id=True))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,133 @@
+import bz2
+import gzip
+import io
+import lzma
+import os
+import sys
+from contextlib import contextmanager
+from typing import IO, Final, Iterator, Optional, Union
+
+# Bytes read or written at once, through the (de)compressor too
+BUFFER_SIZE: Final = 1 << 20
+DEFAULT_LEVEL: Final = 6
+
+EXTENSIONS: Final = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'lzma', '.lzma': 'lzma'}
+MAGIC_BYTES: Final = {b'\x1f\x8b': 'gzip', b'BZh': 'bz2', b'\xfd7zXZ\x00': 'lzma', b'\x5d\x00\x00': 'lzma'}
+MAGIC_SIZE: Final = max(len(magic) for magic in MAGIC_BYTES)
+
+
+def get_compression(path: str) -> Optional[str]:
+    """Guess the compression of a file from its extension
+    Args:
+        path (str): path of the file
+    Returns:
+        Optional[str]: gzip, bz2, lzma, or None for a plain file
+    """
+    return EXTENSIONS.get(os.path.splitext(path)[1].lower())
+
+
+def sniff_compression(path: str) -> Optional[str]:
+    """Detect the compression of an existing file from its first bytes,
+    whatever its extension
+    Args:
+        path (str): path of the file
+    Returns:
+        Optional[str]: gzip, bz2, lzma, or None for a plain file
+    """
+    with open(path, 'rb') as fd:
+        return detect_compression(fd.read(MAGIC_SIZE))
+
+
+def detect_compression(head: bytes) -> Optional[str]:
+    """
+    Args:
+        head (bytes): first bytes of a file (MAGIC_SIZE)
+    Returns:
+        Optional[str]: gzip, bz2, lzma, or None for a plain file
+    """
+    for magic, compression in MAGIC_BYTES.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_file(
+    path: str,
+    mode: str = 'r',
+    compresslevel: int = DEFAULT_LEVEL,
+    compression: Optional[str] = None,
+    newline: Optional[str] = None,
+) -> IO:
+    """Open a plain, gzip, bz2 or lzma (xz) file with large buffers.
+        Files read are detected by their magic bytes, files written are
+        compressed according to their extension (.gz, .bz2, .xz)
+    Args:
+        path (str): path of the file
+        mode (str): r, w, rb or wb
+        compresslevel (int): compression level of written files (lzma preset)
+        compression (Optional[str]): force gzip, bz2 or lzma instead of detecting it
+        newline (Optional[str]): see open, for text modes
+    Returns:
+        IO: text or binary file object, depending on mode
+    """
+    reading = mode[0] == 'r'
+    binary = 'b' in mode
+    if compression is None:
+        compression = sniff_compression(path) if reading else get_compression(path)
+    if compression is None:
+        if binary:
+            return open(path, mode, buffering=BUFFER_SIZE)
+        return open(path, mode, buffering=BUFFER_SIZE, newline=newline)
+
+    return _buffer(_open_compressed(path, mode[0] + 'b', compression, compresslevel), mode, newline)
+
+
+@contextmanager
+def open_stdin(mode: str = 'r', newline: Optional[str] = None) -> Iterator[IO]:
+    """Read the standard input like open_file: its compression is detected
+    by its magic bytes, without consuming them. The standard input stays open
+    Args:
+        mode (str): r or rb
+        newline (Optional[str]): see open, for the text mode of a compressed input
+    Yields:
+        IO: text or binary file object, depending on mode
+    """
+    raw = sys.stdin.buffer
+    compression = detect_compression(raw.peek(MAGIC_SIZE)[:MAGIC_SIZE])
+    if compression is None:
+        yield raw if 'b' in mode else sys.stdin
+        return
+    # The decompressor does not close the file object it reads from
+    with _buffer(_open_compressed(raw, 'rb', compression), mode, newline) as fd:
+        yield fd
+
+
+def _open_compressed(
+    file: Union[str, IO],
+    raw_mode: str,
+    compression: str,
+    compresslevel: int = DEFAULT_LEVEL,
+) -> IO:
+    reading = raw_mode[0] == 'r'
+    if compression == 'gzip':
+        # No timestamp in the header: the same output gives the same file
+        if isinstance(file, str):
+            return gzip.GzipFile(file, raw_mode, compresslevel=compresslevel, mtime=0)
+        return gzip.GzipFile(fileobj=file, mode=raw_mode, compresslevel=compresslevel, mtime=0)
+    if compression == 'bz2':
+        return bz2.BZ2File(file, raw_mode, compresslevel=compresslevel)
+    if compression == 'lzma':
+        return lzma.LZMAFile(file, raw_mode, preset=None if reading else compresslevel)
+    raise ValueError(f'Unknown compression {compression}')
+
+
+def _buffer(stream: IO, mode: str, newline: Optional[str]) -> IO:
+    reading = mode[0] == 'r'
+    binary = 'b' in mode
+    if reading:
+        buffered = io.BufferedReader(stream, BUFFER_SIZE)
+    else:
+        buffered = io.BufferedWriter(stream, BUFFER_SIZE)
+    if binary:
+        return buffered
+    return io.TextIOWrapper(buffered, newline=newline)
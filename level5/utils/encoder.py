@@ -0,0 +1,130 @@
+import json
+from json.encoder import encode_basestring_ascii
+from typing import Any, Callable, Dict, Final, List
+
+# Indentation of json.dumps(..., indent=2) for a rental, inside {"rentals": [...]}
+_RENTAL_START: Final = b'{'
+_RENTAL_END: Final = b'\n    }'
+# Separator of the items of the arrays of a rental (options, actions)
+_ITEM_SEPARATOR: Final = b',\n        '
+_ACTION: Final = (
+    b'{\n          "who": %s,\n          "type": %s,\n          "amount": %d\n        }'
+)
+_ACTION_KEYS: Final = ('who', 'type', 'amount')
+
+_STRINGS_CACHE_SIZE: Final = 1 << 12
+_strings: Dict[str, bytes] = {}
+
+
+class _Fallback(Exception):
+    """The value does not have the shape of the templates"""
+
+
+def _encode_string(value: Any) -> bytes:
+    encoded = _strings.get(value) if type(value) is str else None
+    if encoded is None:
+        if type(value) is not str:
+            raise _Fallback
+        encoded = encode_basestring_ascii(value).encode()
+        if len(_strings) < _STRINGS_CACHE_SIZE:
+            _strings[value] = encoded
+    return encoded
+
+
+def _encode_int(value: Any) -> bytes:
+    if type(value) is not int:
+        raise _Fallback
+    return b'%d' % value
+
+
+def _encode_options(options: Any) -> bytes:
+    if type(options) is not list:
+        raise _Fallback
+    if not options:
+        return b'[]'
+    return b'[\n        ' + _ITEM_SEPARATOR.join(map(_encode_string, options)) + b'\n      ]'
+
+
+def _encode_action(action: Any) -> bytes:
+    if type(action) is not dict or tuple(action) != _ACTION_KEYS:
+        raise _Fallback
+    amount = action['amount']
+    if type(amount) is not int:
+        raise _Fallback
+    return _ACTION % (_encode_string(action['who']), _encode_string(action['type']), amount)
+
+
+def _encode_actions(actions: Any) -> bytes:
+    if type(actions) is not list:
+        raise _Fallback
+    if not actions:
+        return b'[]'
+    return b'[\n        ' + _ITEM_SEPARATOR.join(map(_encode_action, actions)) + b'\n      ]'
+
+
+def _encode_commission(commission: Any) -> bytes:
+    if type(commission) is not dict:
+        raise _Fallback
+    if not commission:
+        return b'{}'
+    return b'{' + b','.join(
+        b'\n        ' + _encode_string(key) + b': ' + _encode_int(value)
+        for key, value in commission.items()
+    ) + b'\n      }'
+
+
+# Key prefix and value encoder of each field of the rentals of all levels
+_FIELDS: Final[Dict[str, Callable[[Any], bytes]]] = {
+    'id': _encode_int,
+    'price': _encode_int,
+    'commission': _encode_commission,
+    'options': _encode_options,
+    'actions': _encode_actions,
+}
+_KEYS: Final = {key: b'\n      ' + json.dumps(key).encode() + b': ' for key in _FIELDS}
+
+
+def encode_rental(rental: Dict) -> bytes:
+    """Serialize the output of one rental exactly like
+    json.dumps(rental, indent=2) nested in {"rentals": [...]}, from templates
+    of the known fields (id, price, commission, options, actions).
+    Other shapes and value types go through json.dumps
+    Args:
+        rental (Dict): output of one rental
+    Returns:
+        bytes: the indented json object, without trailing separator
+    """
+    try:
+        if type(rental) is not dict or not rental:
+            raise _Fallback
+        return _RENTAL_START + b','.join([
+            _KEYS[key] + _FIELDS[key](value) for key, value in rental.items()
+        ]) + _RENTAL_END
+    except (_Fallback, KeyError):
+        # Rentals are nested twice, json strings never contain a raw newline
+        return json.dumps(rental, indent=2).replace('\n', '\n    ').encode()
+
+
+def encode_rentals(rentals: List[Dict]) -> bytes:
+    """
+    Args:
+        rentals (List[Dict]): output of the rentals
+    Returns:
+        bytes: the whole output document, as written by saveJSON
+    """
+    if not rentals:
+        return b'{\n  "rentals": []\n}\n'
+    return b'{\n  "rentals": [\n    ' + b',\n    '.join(map(encode_rental, rentals)) + b'\n  ]\n}\n'
+
+
+def encode_output(output: Any) -> bytes:
+    """Serialize a document exactly like json.dumps(output, indent=2) + a newline,
+    with encode_rentals when it is {"rentals": [...]}
+    Args:
+        output (Any): document to serialize
+    Returns:
+        bytes: the json document
+    """
+    if type(output) is dict and len(output) == 1 and type(output.get('rentals')) is list:
+        return encode_rentals(output['rentals'])
+    return json.dumps(output, indent=2).encode() + b'\n'
@@ -1,8 +1,22 @@
 import json
-from typing import Dict
+import os
+import re
+import sys
+from typing import Any, BinaryIO, Dict, Final, Iterator, List, Optional, TextIO, Tuple
+
+from .compression import DEFAULT_LEVEL, get_compression, open_file, open_stdin
+from .encoder import encode_output, encode_rental
+from .sidecar import RentalIndexWriter, remove_index
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+# Member of the input document each kind of json lines record belongs to
+NDJSON_KINDS: Final = {'car': 'cars', 'rental': 'rentals', 'option': 'options'}
+
 
 def loadJSON(path: str) -> Dict:
-    """Open and load file as JSON
+    """Open and load file as JSON, decompressed on the fly if it is
+    gzip, bz2 or xz (see utils.compression)
     Args:
         path (str): path of the json file
     Returns:
@@ -10,25 +24,343 @@ def loadJSON(path: str) -> Dict:
         Exits with error code 1 if an exception is caught
     """
     try:
-        with open(path, 'r') as fd:
+        with open_file(path) as fd:
             data = json.load(fd)
     except Exception as e:
-        print(e)
+        print(e, file=sys.stderr)
         exit(1)
     return data
 
 
-def saveJSON(rentals: Dict, path: str) -> None:
+def loadNDJSON(path: str) -> List[Dict]:
+    """Open and load a json lines file, one object per line (see loadJSON)
+    Args:
+        path (str): path of the json lines file
+    Returns:
+        List[Dict]: the object of each line
+        Exits with error code 1 if an exception is caught
+    """
+    try:
+        with open_file(path) as fd:
+            data = [json.loads(line) for line in fd if line.strip()]
+    except Exception as e:
+        print(e, file=sys.stderr)
+        exit(1)
+    return data
+
+
+def saveJSON(rentals: Dict, path: str, compresslevel: int = DEFAULT_LEVEL) -> None:
     """Save the output to json file, exit(1) on error
     Args:
         rentals (Dict): output to be saved
-        path (str): path to json file
+        path (str): path to json file, compressed if it ends with .gz, .bz2 or .xz
+        compresslevel (int): compression level of a compressed file
     """
-    string = json.dumps(rentals, indent=2)
+    data = encode_output(rentals)
     try:
-        with open(path, 'w') as fd:
-            fd.write(string + '\n')
+        with open_file(path, 'wb', compresslevel) as fd:
+            fd.write(data)
     except Exception as e:
-        print(e)
+        print(e, file=sys.stderr)
         exit(1)
     print(f"Successfully written file at {path}")
+
+
+class RentalsWriter:
+    """Write the output json file rental by rental, as soon as each one is
+    computed, with the exact layout of saveJSON({'rentals': [...]}),
+    straight into a buffered binary file (see utils.encoder).
+    When index_path is given, the previous index is removed on enter, and the
+    byte offset and length of each rental object are written there along the
+    output, the index being complete on exit (see utils.sidecar).
+    When atomic, files are written next to their path and only replace it on success.
+    The output is compressed when path ends with .gz, .bz2 or .xz (offsets in
+    the index are then positions in the decompressed output).
+    Exits with error code 1 if the file cannot be written
+    Usage:
+        with RentalsWriter(path) as writer:
+            writer.write(rental)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        index_path: Optional[str] = None,
+        config_digest: bytes = b'',
+        atomic: bool = False,
+        compresslevel: int = DEFAULT_LEVEL,
+    ) -> None:
+        self.path = path
+        self.atomic = atomic
+        self.compresslevel = compresslevel
+        self.fd: Optional[BinaryIO] = None
+        self.count = 0
+        self.offset = 0
+        self.index_path = index_path
+        self.config_digest = config_digest
+        self.index: Optional[RentalIndexWriter] = None
+
+    def _write(self, data: bytes) -> None:
+        try:
+            self.fd.write(data)
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+        self.offset += len(data)
+
+    def __enter__(self) -> 'RentalsWriter':
+        try:
+            if self.index_path is not None:
+                remove_index(self.index_path)
+                self.index = RentalIndexWriter(self._target(self.index_path))
+            self.fd = open_file(
+                self._target(self.path), 'wb', self.compresslevel, get_compression(self.path)
+            )
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+        return self
+
+    def write(self, rental: Dict, digest: bytes = b'') -> None:
+        """Append one rental to the "rentals" array
+        Args:
+            rental (Dict): output of one rental
+            digest (bytes): hash of the pricing inputs of the rental, for the index
+        """
+        self.write_raw(rental['id'], encode_rental(rental), digest)
+
+    def write_raw(self, rental_id: int, data: bytes, digest: bytes = b'') -> None:
+        """Append one rental already serialized and indented by write
+        Args:
+            rental_id (int): id of the rental
+            data (bytes): rental object, as written by a previous writer
+            digest (bytes): hash of the pricing inputs of the rental, for the index
+        """
+        self._write(b',\n    ' if self.count else b'{\n  "rentals": [\n    ')
+        if self.index is not None:
+            self.index.add(rental_id, self.offset, len(data), digest)
+        self._write(data)
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self._write(b'\n  ]\n}\n' if self.count else b'{\n  "rentals": []\n}\n')
+        self.fd.close()
+        if exc_type is not None:
+            if self.index is not None:
+                self.index.discard()
+            # The previous output is kept instead of a half-written one
+            if self.atomic:
+                os.remove(self._target(self.path))
+            return
+        if self.index is not None:
+            self.index.save(self.config_digest, os.path.getsize(self._target(self.path)))
+        if self.atomic:
+            os.replace(self._target(self.path), self.path)
+            if self.index is not None:
+                os.replace(self._target(self.index_path), self.index_path)
+        print(f"Successfully written file at {self.path}")
+
+    def _target(self, path: str) -> str:
+        return path + '.tmp' if self.atomic else path
+
+
+class _JSONStream:
+    """Incremental reader of a json document, holding at most one chunk
+    and the element being decoded in memory
+    """
+
+    def __init__(self, fd: TextIO, chunk_size: int) -> None:
+        self.fd = fd
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        if self.eof:
+            return False
+        chunk = self.fd.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError('Unexpected end of json input')
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f'Expected one of {chars!r}, got {char!r}')
+        self.pos += 1
+        return char
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.fill():
+                    continue
+                raise
+            # A number ending the buffer may go on in the next chunk
+            if end == len(self.buffer) and self.fill():
+                continue
+            self.pos = end
+            return value
+
+    def walk(self) -> Iterator[Tuple[str, Any]]:
+        self.expect('{')
+        if self.peek() == '}':
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise ValueError(f'Expected an object key, got {key!r}')
+            self.expect(':')
+            if self.peek() == '[':
+                self.pos += 1
+                if self.peek() == ']':
+                    self.pos += 1
+                else:
+                    while True:
+                        yield key, self.value()
+                        if self.expect(',]') == ']':
+                            break
+            else:
+                yield key, self.value()
+            if self.expect(',}') == '}':
+                return
+
+
+def iterJSON(path: str, chunk_size: int = 1 << 16) -> Iterator[Tuple[str, Any]]:
+    """Walk the top-level object of a json file without loading it as a whole.
+        Arrays are walked element by element, any other value is yielded as is.
+        Compressed files are decompressed on the fly (see loadJSON)
+    Args:
+        path (str): path of the json file
+        chunk_size (int): number of characters read at once
+    Yields:
+        Tuple[str, Any]: key of the top-level member and one of its elements
+        Exits with error code 1 if an exception is caught
+    """
+    try:
+        with open_file(path) as fd:
+            yield from _JSONStream(fd, chunk_size).walk()
+    except Exception as e:
+        print(e, file=sys.stderr)
+        exit(1)
+
+
+def iterNDJSON(path: str) -> Iterator[Tuple[str, Any]]:
+    """Read a json lines file of records tagged by "kind" (car, rental or option),
+    e.g. {"kind": "car", "id": 1, "price_per_day": 2000, "price_per_km": 10}.
+    Compressed files are decompressed on the fly (see loadJSON)
+    Args:
+        path (str): path of the json lines file, - for the standard input
+    Yields:
+        Tuple[str, Any]: like iterJSON, the member of the input document the
+        record belongs to (cars, rentals or options) and the record without its kind
+        Exits with error code 1 if an exception is caught
+    """
+    try:
+        with open_file(path) if path != '-' else open_stdin() as fd:
+            for line_number, line in enumerate(fd, 1):
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                kind = record.pop('kind', None)
+                if kind not in NDJSON_KINDS:
+                    raise ValueError(f'{path}:{line_number}: unknown record kind {kind!r}')
+                yield NDJSON_KINDS[kind], record
+    except Exception as e:
+        print(e, file=sys.stderr)
+        exit(1)
+
+
+class NDJSONWriter:
+    """Write the output rental by rental as json lines, one rental object per line.
+    When index_path is given, the byte offset and length of each line are
+    written there along the output, like RentalsWriter.
+    Exits with error code 1 if the file cannot be written
+    Usage:
+        with NDJSONWriter(path) as writer:
+            writer.write(rental)
+    """
+
+    def __init__(
+        self,
+        path: str,
+        compresslevel: int = DEFAULT_LEVEL,
+        index_path: Optional[str] = None,
+    ) -> None:
+        """
+        Args:
+            path (str): path of the json lines file, - for the standard output,
+                compressed if it ends with .gz, .bz2 or .xz
+            compresslevel (int): compression level of a compressed file
+            index_path (Optional[str]): path of the sidecar index (see utils.sidecar)
+        """
+        self.path = path
+        self.compresslevel = compresslevel
+        self.fd: Optional[TextIO] = None
+        self.count = 0
+        self.offset = 0
+        self.index_path = index_path
+        self.index: Optional[RentalIndexWriter] = None
+        self._encode = json.JSONEncoder(separators=(',', ':')).encode
+
+    def __enter__(self) -> 'NDJSONWriter':
+        try:
+            if self.index_path is not None:
+                remove_index(self.index_path)
+                self.index = RentalIndexWriter(self.index_path)
+            if self.path == '-':
+                self.fd = sys.stdout
+            else:
+                self.fd = open_file(self.path, 'w', self.compresslevel, newline='\n')
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+        return self
+
+    def write(self, rental: Dict) -> None:
+        """Append one rental line
+        Args:
+            rental (Dict): output of one rental
+        """
+        # Lines are ascii only: their length is their size in bytes
+        line = self._encode(rental)
+        try:
+            self.fd.write(line + '\n')
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+        if self.index is not None:
+            self.index.add(rental['id'], self.offset, len(line))
+        self.offset += len(line) + 1
+        self.count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self.path == '-':
+            # The standard output only holds the rentals
+            self.fd.flush()
+            return
+        self.fd.close()
+        if exc_type is not None:
+            if self.index is not None:
+                self.index.discard()
+            return
+        if self.index is not None:
+            self.index.save(output_size=os.path.getsize(self.path))
+        print(f"Successfully written file at {self.path}")
@@ -0,0 +1,198 @@
+import cProfile
+import sys
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO
+
+try:
+    import resource
+except ImportError:  # resource is unix only
+    resource = None
+
+
+def get_peak_memory() -> Optional[int]:
+    """
+    Returns:
+        Optional[int]: peak resident memory of the process so far, in bytes,
+        None if it cannot be measured on this platform
+    """
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageStats:
+    """Wall time and cpu time of one stage, and peak memory of the process
+    when it ended: ru_maxrss is kept for the whole process, so this peak may
+    come from an earlier stage, it only grows from one stage to the next
+    """
+
+    __slots__ = ('wall', 'cpu', 'process_peak', 'calls')
+
+    def __init__(self) -> None:
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.process_peak: Optional[int] = None
+        self.calls = 0
+
+    def add(self, wall: float, cpu: float) -> None:
+        self.wall += wall
+        self.cpu += cpu
+        self.calls += 1
+
+
+class LatencyHistogram:
+    """Count latencies in power of two buckets of microseconds"""
+
+    def __init__(self) -> None:
+        self.counts: List[int] = []
+
+    def add(self, seconds: float) -> None:
+        bucket = int(seconds * 1_000_000).bit_length()
+        if bucket >= len(self.counts):
+            self.counts.extend([0] * (bucket + 1 - len(self.counts)))
+        self.counts[bucket] += 1
+
+    def __len__(self) -> int:
+        return sum(self.counts)
+
+    def lines(self) -> List[str]:
+        total = len(self)
+        width = max(self.counts, default=0)
+        first = next((bucket for bucket, count in enumerate(self.counts) if count), 0)
+        lines = []
+        for bucket, count in enumerate(self.counts[first:], first):
+            upper = 1 << bucket
+            bar = '#' * (40 * count // width) if width else ''
+            lines.append(f'  < {upper:>8} us {count:>10} {100 * count / total:6.2f}% {bar}')
+        return lines
+
+
+class StageProfiler:
+    """Measure each stage of a run. When disabled, every method is a no-op
+    with (almost) no overhead.
+        Stages that are interleaved (e.g. compute and save when streaming)
+        are measured item by item with iter_stage and wrap, and summed
+    Usage:
+        with StageProfiler(enabled=True) as profiler:
+            with profiler.stage('load'):
+                data = loadJSON(path)
+            for rental in profiler.iter_stage('compute', rentals):
+                ...
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        latency: bool = False,
+        stats_path: Optional[str] = None,
+        stream: Optional[TextIO] = None,
+    ) -> None:
+        """
+        Args:
+            enabled (bool): measure the stages and print them on exit
+            latency (bool): keep a histogram of the duration of each item of iter_stage
+            stats_path (Optional[str]): dump the cProfile stats of the run to this file
+            stream (Optional[TextIO]): where the report is printed, the standard
+                output by default (the standard error keeps it out of an output piped there)
+        """
+        self.enabled = enabled
+        self.stages: Dict[str, StageStats] = {}
+        self.latency = LatencyHistogram() if latency else None
+        self.stats_path = stats_path
+        self.stream = stream
+        self._profile: Optional[cProfile.Profile] = None
+
+    def __enter__(self) -> 'StageProfiler':
+        if self.stats_path is not None:
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if self._profile is not None:
+            self._profile.disable()
+            self._profile.dump_stats(self.stats_path)
+            print(f"Profile stats written at {self.stats_path}", file=self.stream or sys.stdout)
+        if self.enabled and exc_type is None:
+            print(self.report(), file=self.stream or sys.stdout)
+
+    def _get(self, name: str) -> StageStats:
+        stats = self.stages.get(name)
+        if stats is None:
+            stats = self.stages[name] = StageStats()
+        return stats
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Measure the block as one call of the stage"""
+        if not self.enabled:
+            yield
+            return
+        wall, cpu = time.perf_counter(), time.process_time()
+        yield
+        stats = self._get(name)
+        stats.add(time.perf_counter() - wall, time.process_time() - cpu)
+        stats.process_peak = get_peak_memory()
+
+    def iter_stage(self, name: str, items: Iterable) -> Iterator:
+        """Measure the production of each item of an iterable as one call of the stage
+        Args:
+            name (str): name of the stage
+            items (Iterable): lazily computed items
+        Returns:
+            Iterator: the items
+        """
+        if not self.enabled:
+            return iter(items)
+        return self._iter_measured(self._get(name), iter(items))
+
+    def _iter_measured(self, stats: StageStats, iterator: Iterator) -> Iterator:
+        while True:
+            wall, cpu = time.perf_counter(), time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            elapsed = time.perf_counter() - wall
+            stats.add(elapsed, time.process_time() - cpu)
+            if self.latency is not None:
+                self.latency.add(elapsed)
+            yield item
+        stats.process_peak = get_peak_memory()
+
+    def wrap(self, name: str, function: Callable) -> Callable:
+        """
+        Returns:
+            Callable: function measuring each of its calls as one call of the stage
+        """
+        if not self.enabled:
+            return function
+        stats = self._get(name)
+
+        def measured(*args, **kwargs) -> Any:
+            wall, cpu = time.perf_counter(), time.process_time()
+            result = function(*args, **kwargs)
+            stats.add(time.perf_counter() - wall, time.process_time() - cpu)
+            return result
+        return measured
+
+    def report(self) -> str:
+        """
+        Returns:
+            str: table of the stages (with the peak memory of the process when
+            each stage ended, see StageStats), and the latency histogram if kept
+        """
+        process_peak = get_peak_memory()
+        lines = [f"{'stage':<12} {'calls':>10} {'wall (s)':>10} {'cpu (s)':>10} {'process peak (MiB)':>19}"]
+        for name, stats in self.stages.items():
+            peak = stats.process_peak if stats.process_peak is not None else process_peak
+            peak_text = f'{peak / (1 << 20):19.1f}' if peak is not None else f"{'-':>19}"
+            lines.append(
+                f'{name:<12} {stats.calls:>10} {stats.wall:>10.4f} {stats.cpu:>10.4f} {peak_text}'
+            )
+        if self.latency is not None and len(self.latency):
+            lines.append('Latency per rental:')
+            lines.extend(self.latency.lines())
+        return '\n'.join(lines)
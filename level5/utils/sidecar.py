@@ -0,0 +1,208 @@
+import heapq
+import mmap
+import os
+import struct
+import sys
+from typing import Final, Iterator, NamedTuple, Optional, Tuple
+
+# magic, number of records, hash of the pricing configuration, size of the
+# output file the records point into
+HEADER = struct.Struct('<8sQ16sQ')
+# rental id, byte offset and length of its object in the output, pricing inputs hash
+RECORD = struct.Struct('<qQI16s')
+MAGIC = b'GARIDX2\0'
+# Records sorted at once in memory when the rentals are not written in
+# increasing id order, and records read at once from each sorted run when merging them
+SORT_RUN_SIZE: Final = 1 << 16
+MERGE_BLOCK_SIZE: Final = 1 << 8
+
+
+def get_index_path(output_path: str) -> str:
+    return output_path + '.idx'
+
+
+def remove_index(path: str) -> None:
+    """Remove the sidecar of an output about to be written again, so it never
+    describes another output (e.g. after a failed run)
+    Args:
+        path (str): path of the sidecar file
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class IndexRecord(NamedTuple):
+    offset: int
+    length: int
+    digest: bytes
+
+
+class RentalIndexWriter:
+    """Write the position of each rental written in an output file to a binary
+    sidecar of fixed-width records, sorted by rental id.
+        Records are written to the file as they are added, so memory does not
+        grow with the output. When the rentals were not written in increasing
+        id order, the records are sorted on save by runs of run_size records,
+        then the runs are merged.
+    Exits with error code 1 if the file cannot be written
+    Usage:
+        index = RentalIndexWriter(path)
+        index.add(rental_id, offset, length)
+        index.save()
+    """
+
+    def __init__(self, path: str, run_size: int = SORT_RUN_SIZE) -> None:
+        """
+        Args:
+            path (str): path of the sidecar file
+            run_size (int): number of records sorted at once in memory
+        """
+        self.path = path
+        self.run_size = run_size
+        self.count = 0
+        self.increasing = True
+        self._last_id: Optional[int] = None
+        try:
+            self.fd = open(path, 'w+b')
+            # The file is not a valid index until save writes its header
+            self.fd.write(bytes(HEADER.size))
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+
+    def add(self, rental_id: int, offset: int, length: int, digest: bytes = b'') -> None:
+        """
+        Args:
+            rental_id (int): id of the rental
+            offset (int): byte offset of the rental object in the output
+            length (int): byte length of the rental object
+            digest (bytes): hash of the pricing inputs of the rental (16 bytes)
+        """
+        if self._last_id is not None and rental_id <= self._last_id:
+            self.increasing = False
+        self._last_id = rental_id
+        try:
+            self.fd.write(RECORD.pack(rental_id, offset, length, digest))
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+        self.count += 1
+
+    def _iter_run(self, start: int, end: int) -> Iterator[Tuple]:
+        for block in range(start, end, MERGE_BLOCK_SIZE):
+            self.fd.seek(HEADER.size + block * RECORD.size)
+            yield from RECORD.iter_unpack(self.fd.read(min(MERGE_BLOCK_SIZE, end - block) * RECORD.size))
+
+    def _sort(self) -> None:
+        runs = []
+        for start in range(0, self.count, self.run_size):
+            end = min(start + self.run_size, self.count)
+            self.fd.seek(HEADER.size + start * RECORD.size)
+            # Rental ids are unique: the records are sorted by id
+            records = sorted(RECORD.iter_unpack(self.fd.read((end - start) * RECORD.size)))
+            self.fd.seek(HEADER.size + start * RECORD.size)
+            self.fd.write(b''.join(RECORD.pack(*record) for record in records))
+            runs.append((start, end))
+        if len(runs) < 2:
+            return
+        merged_path = self.path + '.sort'
+        with open(merged_path, 'wb') as merged:
+            merged.write(bytes(HEADER.size))
+            for record in heapq.merge(*(self._iter_run(start, end) for start, end in runs)):
+                merged.write(RECORD.pack(*record))
+        self.fd.close()
+        os.replace(merged_path, self.path)
+        self.fd = open(self.path, 'r+b')
+
+    def save(self, config_digest: bytes = b'', output_size: int = 0) -> None:
+        """Sort the records if needed and write the header of the sidecar file
+        Args:
+            config_digest (bytes): hash of the pricing configuration (16 bytes)
+            output_size (int): size of the output file on disk, to detect an
+                output written again without its index
+        """
+        try:
+            if not self.increasing:
+                self._sort()
+            self.fd.seek(0)
+            self.fd.write(HEADER.pack(
+                MAGIC, self.count, config_digest.ljust(16, b'\0')[:16], output_size
+            ))
+            self.fd.close()
+        except Exception as e:
+            print(e, file=sys.stderr)
+            exit(1)
+
+    def discard(self) -> None:
+        """Close and remove the sidecar file of an output that was not written"""
+        self.fd.close()
+        remove_index(self.path)
+
+
+class RentalIndex:
+    """Read-only view of a sidecar file, memory-mapped.
+        Lookups are O(1) when rental ids are consecutive, a binary search otherwise
+    Usage:
+        with RentalIndex(path) as index:
+            record = index.get(rental_id)
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, 'rb') as fd:
+            self._map = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count, self.config_digest, self.output_size = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f'{path} is not a rental index')
+        self._first_id = self._id_at(0) if self.count else 0
+        self._dense = bool(self.count) and (
+            self._id_at(self.count - 1) - self._first_id == self.count - 1
+        )
+
+    def __enter__(self) -> 'RentalIndex':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self) -> None:
+        self._map.close()
+
+    def _id_at(self, position: int) -> int:
+        return struct.unpack_from('<q', self._map, HEADER.size + position * RECORD.size)[0]
+
+    def _find(self, rental_id: int) -> int:
+        if self._dense:
+            position = rental_id - self._first_id
+            return position if 0 <= position < self.count else -1
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self._id_at(middle) < rental_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count and self._id_at(low) == rental_id:
+            return low
+        return -1
+
+    def get(self, rental_id: int) -> Optional[IndexRecord]:
+        """
+        Args:
+            rental_id (int): id of the rental
+        Returns:
+            Optional[IndexRecord]: offset, length and hash of the rental,
+            None if it is not indexed
+        """
+        position = self._find(rental_id)
+        if position < 0:
+            return None
+        _, offset, length, digest = RECORD.unpack_from(
+            self._map, HEADER.size + position * RECORD.size
+        )
+        return IndexRecord(offset, length, digest)